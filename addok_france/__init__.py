@@ -1,19 +1,84 @@
+from importlib.metadata import PackageNotFoundError, version
+
 from addok.helpers import yielder
 
-from . import utils
+from . import (aliases, batch, cities, departments, documents,  # noqa
+               housenumbers, incremental, metrics, postcodes, replay, shadow,
+               utils)
+from .cache import memoize
+
 try:
-    import pkg_resources
-except ImportError:  # pragma: no cover
+    VERSION = version(__package__)
+except PackageNotFoundError:  # pragma: no cover
     pass
-else:
-    if __package__:
-        VERSION = pkg_resources.get_distribution(__package__).version
 
 
-clean_query = yielder(utils.clean_query)
-extract_address = yielder(utils.extract_address)
+def preconfigure(config):
+    # Max number of entries of each query processor cache (0 to disable).
+    config.FRANCE_QUERY_CACHE_SIZE = 0
+    # Max number of labels per result (0 for no limit).
+    config.FRANCE_LABELS_MAX = 0
+    # Let score_by_ngram_distance compute labels only as needed.
+    config.FRANCE_LABELS_LAZY = False
+    # Store a signature of each label with prepare_labels, for
+    # score_by_ngram_distance to skip the labels which cannot score better.
+    config.FRANCE_LABELS_SIGNATURES = False
+    # Record calls and time of the France processors (see metrics.snapshot).
+    config.FRANCE_METRICS = False
+    # CSV file of CEDEX codes and their postcode, used by clean_query.
+    config.FRANCE_CEDEX_PATH = None
+    # CSV file of city names and their citycode, used by routing_hint and
+    # city_filter.
+    config.FRANCE_CITIES_PATH = None
+    # Table built by france-aliases, expanding the city names of a citycode
+    # in the index and the labels.
+    config.FRANCE_CITY_ALIASES_PATH = None
+    # Below this confidence, routing_hint tells to broadcast the query.
+    config.FRANCE_ROUTING_MIN_CONFIDENCE = 0.5
+    # Max number of characters searched by extract_address (0 for no limit).
+    config.FRANCE_EXTRACT_MAX_LENGTH = 1000
+    # How far match_housenumber may look for the nearest existing housenumber
+    # (0 to only fall back to the same number, eg. 3b => 3, None for exact
+    # matches only).
+    config.FRANCE_HOUSENUMBER_MAX_DISTANCE = None
+    # Reindex the documents skip_unchanged would skip.
+    config.FRANCE_REINDEX_FORCE = False
+    # Query processors to run next to QUERY_PROCESSORS, logging divergences.
+    config.FRANCE_SHADOW_QUERY_PROCESSORS_PYPATHS = []
+
+
+def register_command(subparsers):
+    aliases.register_command(subparsers)
+    batch.register_command(subparsers)
+    documents.register_command(subparsers)
+    incremental.register_command(subparsers)
+    replay.register_command(subparsers)
+    shadow.register_command(subparsers)
+
+
+def register_http_endpoint(api):
+    departments.register_http_endpoint(api)
+
+
+canonicalize = utils.canonicalize
+city_filter = cities.city_filter
+clean_query = yielder(memoize(utils.clean_query))
+clean_query_batch = utils.clean_query_batch
+department_hint = departments.department_hint
+extract_address = yielder(memoize(utils.extract_address))
+extract_address_batch = utils.extract_address_batch
 glue_ordinal = utils.glue_ordinal
 fold_ordinal = yielder(utils.fold_ordinal)
 flag_housenumber = utils.flag_housenumber
+housenumber_pipeline = utils.housenumber_pipeline
 make_labels = utils.make_labels
-remove_leading_zeros = yielder(utils.remove_leading_zeros)
+match_housenumber = housenumbers.match_housenumber
+normalize_query = yielder(memoize(utils.normalize_query))
+postcode_filter = postcodes.postcode_filter
+prepare_housenumbers = yielder(documents.prepare_housenumbers)
+prepare_labels = yielder(utils.prepare_labels)
+remove_leading_zeros = yielder(memoize(utils.remove_leading_zeros))
+routing_hint = departments.routing_hint
+score_by_ngram_distance = utils.score_by_ngram_distance
+skip_unchanged = incremental.skip_unchanged
+store_hashes = incremental.store_hashes
@@ -0,0 +1,207 @@
+"""
+Citycode => valid city names table, for the communes nouvelles.
+
+Built once from a cities CSV file (a name and a citycode per row, the former
+names of a commune nouvelle listed with its citycode):
+
+    addok france-aliases cities.csv --output aliases.bin
+
+and memory-mapped, read-only, from the file set in FRANCE_CITY_ALIASES_PATH,
+so all the workers share the same pages. Only citycodes with more than one
+name are kept.
+
+Documents only need to store their own city name: CityAliasesIndexer adds the
+other ones before the city is indexed (and deindexed), and make_labels adds
+them to the labels at search time. The checksum of the table is stored next
+to the documents, so they are not indexed nor deindexed with another table.
+
+File layout: a header (MAGIC, number of citycodes), the sorted citycodes each
+with the offset and length of its names, then the names, UTF-8 encoded and
+separated by "\\n".
+"""
+import hashlib
+import mmap
+import struct
+
+from addok.config import config
+from addok.db import DB
+
+MAGIC = b"FRA1"
+HEADER = struct.Struct("<4sI")
+ENTRY = struct.Struct("<5sII")
+CITYCODE = struct.Struct("<5s")
+
+# Checksum of the table the documents are indexed with.
+CHECKSUM_KEY = "france|aliases"
+
+# Path => AliasTable.
+_TABLES = {}
+# Checksums of the tables checked against CHECKSUM_KEY.
+_CHECKED = set()
+
+
+def register_command(subparsers):
+    parser = subparsers.add_parser(
+        "france-aliases",
+        help="Build the city aliases table of FRANCE_CITY_ALIASES_PATH",
+    )
+    parser.add_argument("filepath", help="CSV file of city names and citycodes")
+    parser.add_argument("--output", required=True, help="Table file to write")
+    parser.set_defaults(func=run)
+
+
+def write_table(rows, path):
+    """Write the table of the (name, citycode) rows to `path`.
+
+    Return the number of citycodes with aliases.
+    """
+    names = {}
+    for name, citycode in rows:
+        citycode = citycode.upper()
+        if len(citycode.encode()) != CITYCODE.size:
+            raise ValueError("Invalid citycode: {!r}".format(citycode))
+        known = names.setdefault(citycode, [])
+        if name not in known:
+            known.append(name)
+    aliased = sorted((code, ns) for code, ns in names.items() if len(ns) > 1)
+    entries = []
+    blobs = []
+    offset = 0
+    for citycode, ns in aliased:
+        blob = "\n".join(ns).encode()
+        entries.append(ENTRY.pack(citycode.encode(), offset, len(blob)))
+        blobs.append(blob)
+        offset += len(blob)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(entries)))
+        f.writelines(entries)
+        f.writelines(blobs)
+    return len(entries)
+
+
+class AliasTable:
+    def __init__(self, buffer):
+        magic, self.count = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError("Not a city aliases table")
+        self.buffer = buffer
+        self.names_offset = HEADER.size + self.count * ENTRY.size
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def checksum(self):
+        return hashlib.blake2b(self.buffer, digest_size=16).hexdigest()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "rb") as f:
+            if not f.seek(0, 2):
+                return cls(HEADER.pack(MAGIC, 0))  # mmap fails on empty files.
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def get(self, citycode):
+        """Return the city names of a citycode, if it has aliases."""
+        if not citycode or not isinstance(citycode, str):
+            return None
+        code = citycode.upper().encode()
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            position = HEADER.size + middle * ENTRY.size
+            current = CITYCODE.unpack_from(self.buffer, position)[0]
+            if current < code:
+                low = middle + 1
+            elif current > code:
+                high = middle
+            else:
+                _, offset, length = ENTRY.unpack_from(self.buffer, position)
+                start = self.names_offset + offset
+                return self.buffer[start:start + length].decode().split("\n")
+        return None
+
+
+def get_table():
+    path = config.FRANCE_CITY_ALIASES_PATH
+    if not path:
+        return None
+    table = _TABLES.get(path)
+    if table is None:
+        table = _TABLES[path] = AliasTable.from_file(path)
+    return table
+
+
+def expand(cities, citycode):
+    """Return the city names of a document, with the aliases of its citycode.
+
+    The document ones come first. Without a table, or for a citycode without
+    aliases, `cities` is returned as is.
+    """
+    table = get_table()
+    names = table.get(citycode) if table is not None else None
+    if not names:
+        return cities
+    cities = list(cities)
+    return cities + [name for name in names if name not in cities]
+
+
+def check_table(table):
+    """Raise ValueError if the documents are indexed with another table."""
+    checksum = table.checksum
+    if checksum in _CHECKED:
+        return
+    stored = DB.get(CHECKSUM_KEY)
+    if stored is not None and stored.decode() != checksum:
+        raise ValueError(
+            "Documents indexed with another city aliases table than {}, "
+            "reset and reindex them.".format(config.FRANCE_CITY_ALIASES_PATH)
+        )
+    DB.set(CHECKSUM_KEY, checksum)
+    _CHECKED.add(checksum)
+
+
+class CityAliasesIndexer:
+    """Add the city names of the table to the document, before indexing it.
+
+    Must come before FieldsIndexer, and the documents be stored before they
+    are indexed, as with the default BATCH_PROCESSORS, so that stored documents
+    keep their own names only.
+    """
+
+    @staticmethod
+    def expand(doc):
+        table = get_table()
+        if table is None:
+            return
+        check_table(table)
+        cities = doc.get("city")
+        if isinstance(cities, str):
+            cities = [cities]
+        if cities:
+            doc["city"] = expand(cities, doc.get("citycode"))
+
+    @classmethod
+    def index(cls, pipe, key, doc, tokens, **kwargs):
+        cls.expand(doc)
+
+    @classmethod
+    def deindex(cls, db, key, doc, tokens, **kwargs):
+        cls.expand(doc)
+
+
+def run(args):
+    # Not at module level: departments imports utils, which imports us.
+    from .departments import read_cities
+
+    count = write_table(read_cities(args.filepath), args.output)
+    print("{} citycodes with aliases.".format(count))
+
+
+@config.on_load
+def on_load():
+    if config.FRANCE_CITY_ALIASES_PATH:
+        # Map the table before the workers are forked.
+        get_table()
+        if CityAliasesIndexer not in config.INDEXERS:
+            config.INDEXERS = [CityAliasesIndexer] + config.INDEXERS
@@ -0,0 +1,147 @@
+"""
+Normalize large CSV files of raw addresses, before geocoding them.
+
+    addok france-normalize input.csv --column address --output output.csv
+
+Rows are read lazily and normalized in chunks across a process pool, while
+only a few chunks are in flight at once, so memory stays bounded whatever the
+size of the input. Output rows are written in input order.
+"""
+import csv
+import os
+import sys
+from collections import deque
+from functools import partial
+from itertools import islice
+
+from addok import helpers
+from addok.config import config
+
+from . import utils
+
+
+def normalize(q):
+    return utils.clean_query(utils.extract_address(q))
+
+
+def normalize_chunk(queries):
+    """Same as `[normalize(q) for q in queries]`, in bulk."""
+    return utils.clean_query_batch(utils.extract_address_batch(queries))
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _worker_init(*args):
+    # Same as addok's, plus the processors overridden by path, which are
+    # resolved before the overrides are applied.
+    helpers._worker_init(*args)
+    config.resolve()
+
+
+def get_pool(workers, method=None):
+    """Return a pool of `workers` processes with the config of this process.
+
+    Same start method as addok.helpers.parallelize by default: "spawn" on
+    macOS, "fork" elsewhere. Workers which are not forked load the config
+    again, then apply the overridden values.
+    """
+    # Only needed here, and slow to import.
+    from multiprocessing import get_context
+
+    from addok.db import get_redis_params
+
+    method = method or ("spawn" if sys.platform == "darwin" else "fork")
+    env = {
+        key: os.environ[key] for key in ["ADDOK_CONFIG_MODULE"] if key in os.environ
+    }
+    return get_context(method).Pool(
+        workers,
+        initializer=_worker_init,
+        initargs=(get_redis_params(), env, helpers._get_config_overrides()),
+    )
+
+
+def imap_chunks(func, iterable, chunksize=1000, workers=None, method=None):
+    """Yield `func(chunk)` for each chunk of `iterable`, in input order.
+
+    At most twice as many chunks as workers are read ahead of the consumer.
+    With a single worker, everything runs in the current process. `method`
+    is the start method of the workers (see get_pool).
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from map(func, chunks(iterable, chunksize))
+        return
+    with get_pool(workers, method) as pool:
+        pending = deque()
+        for chunk in chunks(iterable, chunksize):
+            if len(pending) >= workers * 2:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(func, (chunk,)))
+        while pending:
+            yield pending.popleft().get()
+
+
+def normalize_rows(rows, column, target, chunksize=1000, workers=None,
+                   method=None):
+    """Yield each row (a dict) with `target` set to its normalized `column`."""
+    func = partial(_normalize_rows, column=column, target=target)
+    for chunk in imap_chunks(func, rows, chunksize, workers, method):
+        yield from chunk
+
+
+def _normalize_rows(rows, column, target):
+    normalized = normalize_chunk([row.get(column) or "" for row in rows])
+    for row, value in zip(rows, normalized):
+        row[target] = value
+    return rows
+
+
+def register_command(subparsers):
+    parser = subparsers.add_parser(
+        "france-normalize", help="Normalize addresses of a CSV file"
+    )
+    parser.add_argument("filepath", nargs="?", help="CSV file (default: stdin)")
+    parser.add_argument("--column", required=True, help="Column to normalize")
+    parser.add_argument(
+        "--target",
+        help="Column to write the result to (default: replace --column)",
+    )
+    parser.add_argument("--output", help="Output CSV file (default: stdout)")
+    parser.add_argument("--delimiter", default=",", help="CSV delimiter")
+    parser.add_argument(
+        "--workers", type=int, help="Number of processes (default: CPU count)"
+    )
+    parser.add_argument(
+        "--chunksize", type=int, default=1000, help="Rows sent at once to a worker"
+    )
+    parser.set_defaults(func=run)
+
+
+def run(args):
+    f = open(args.filepath, newline="") if args.filepath else sys.stdin
+    output = open(args.output, "w", newline="") if args.output else sys.stdout
+    try:
+        reader = csv.DictReader(f, delimiter=args.delimiter)
+        target = args.target or args.column
+        fieldnames = list(reader.fieldnames or [])
+        if target not in fieldnames:
+            fieldnames.append(target)
+        writer = csv.DictWriter(output, fieldnames, delimiter=args.delimiter)
+        writer.writeheader()
+        rows = normalize_rows(
+            reader, args.column, target, args.chunksize, args.workers
+        )
+        writer.writerows(rows)
+    finally:
+        if args.filepath:
+            f.close()
+        if args.output:
+            output.close()
@@ -0,0 +1,97 @@
+import os
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from addok.config import config
+
+# Name of the memoized function => its cache.
+CACHES = {}
+
+
+class LRUCache:
+    """Least recently used cache, with hits/misses/evictions counters.
+
+    Each process gets its own cache: entries inherited from the parent after
+    a fork are kept (they are still valid), but counters start from zero.
+    """
+
+    def __init__(self):
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, maxsize):
+        with self.lock:
+            self.data[key] = value
+            while len(self.data) > maxsize:
+                self.data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.data),
+        }
+
+    def _after_fork(self):
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+
+def memoize(func):
+    """Cache `func(q)` results, up to FRANCE_QUERY_CACHE_SIZE entries.
+
+    A size of 0 (or no size at all) disables the cache.
+    """
+    cache = CACHES[func.__name__] = LRUCache()
+
+    @wraps(func)
+    def wrapper(q):
+        maxsize = config.FRANCE_QUERY_CACHE_SIZE
+        if not maxsize:
+            return func(q)
+        value = cache.get(q)
+        if value is None:
+            value = func(q)
+            cache.set(q, value, maxsize)
+        return value
+
+    return wrapper
+
+
+def stats():
+    """Return counters of each query processor cache for this process."""
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+def clear():
+    for cache in CACHES.values():
+        cache.clear()
+
+
+def _after_fork():
+    for cache in CACHES.values():
+        cache._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,65 @@
+"""
+CEDEX code => geographic postcode table.
+
+The table is read, on first use, from the CSV file set in FRANCE_CEDEX_PATH
+(a CEDEX code and a postcode per row, eg. "31068;31000"; rows not starting
+with two codes, like a header, are skipped), and kept as two sorted arrays.
+"""
+import bisect
+import csv
+from array import array
+
+from addok.config import config
+
+# Path => CedexTable.
+_TABLES = {}
+
+
+class CedexTable:
+    def __init__(self, pairs):
+        pairs = sorted(pairs)
+        self.codes = array("i", (code for code, _ in pairs))
+        self.postcodes = array("i", (postcode for _, postcode in pairs))
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, newline="") as f:
+            first = f.readline()
+            f.seek(0)
+            delimiter = next((d for d in ";\t" if d in first), ",")
+            return cls(_read_pairs(csv.reader(f, delimiter=delimiter)))
+
+    def get(self, code):
+        """Return the postcode of a CEDEX code (a string), if known."""
+        if not code.isdigit():
+            return None
+        code = int(code)
+        index = bisect.bisect_left(self.codes, code)
+        if index < len(self.codes) and self.codes[index] == code:
+            return "{:05d}".format(self.postcodes[index])
+        return None
+
+
+def _read_pairs(rows):
+    for row in rows:
+        if len(row) >= 2 and row[0].strip().isdigit() and row[1].strip().isdigit():
+            yield int(row[0]), int(row[1])
+
+
+def get_table():
+    path = config.FRANCE_CEDEX_PATH
+    if not path:
+        return None
+    table = _TABLES.get(path)
+    if table is None:
+        table = _TABLES[path] = CedexTable.from_file(path)
+    return table
+
+
+def resolve(code):
+    """Return the postcode of a CEDEX code, if a table is configured."""
+    table = get_table()
+    return table.get(code) if table is not None else None
@@ -0,0 +1,118 @@
+"""
+Turn the city name ending the query into a `citycode` filter.
+
+Add "citycode" to FILTERS, and to SEARCH_PREPROCESSORS_PYPATHS, right after
+addok_france.postcode_filter (or addok.helpers.search.tokenize):
+
+    "addok_france.city_filter",
+
+City names and their citycode are read from the CSV file set in
+FRANCE_CITIES_PATH. List the former names of the communes nouvelles with the
+citycode of the new commune for them to be recognized too.
+"""
+from addok.config import config
+from addok.db import DB
+from addok.helpers import iter_pipe, keys
+
+from .departments import department_of, read_cities
+from .postcodes import is_postcode
+from .utils import is_street_type
+
+# Words before a name which is not the city: "avenue de Lyon".
+CONNECTORS = {"a", "au", "aux", "d", "de", "des", "du", "en", "l", "la", "le",
+              "les", "sur"}
+
+# Path => CityTrie.
+_TRIES = {}
+
+
+def tokens(name):
+    return [str(token) for token in iter_pipe(name, config.PROCESSORS)]
+
+
+class CityTrie:
+    """Tokens of the city names, last token first, in nested dicts.
+
+    The citycodes of a name are stored under the `None` key of the node of its
+    first token.
+    """
+
+    def __init__(self, cities):
+        self.root = {}
+        for name, citycode in cities:
+            node = self.root
+            for token in reversed(tokens(name)):
+                node = node.setdefault(token, {})
+            citycodes = node.setdefault(None, [])
+            if citycode not in citycodes:
+                citycodes.append(citycode)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(read_cities(path))
+
+    def match(self, words):
+        """Return (start, citycodes) of the longest name ending `words`."""
+        node, found = self.root, None
+        for index in range(len(words) - 1, -1, -1):
+            node = node.get(words[index])
+            if node is None:
+                break
+            if None in node:
+                found = index, node[None]
+        return found
+
+
+def get_trie():
+    path = config.FRANCE_CITIES_PATH
+    if not path:
+        return None
+    trie = _TRIES.get(path)
+    if trie is None:
+        trie = _TRIES[path] = CityTrie.from_file(path)
+    return trie
+
+
+def city_filter(helper):
+    if "citycode" not in config.FILTERS or len(helper.tokens) < 2:
+        return
+    prefix = keys.filter_key("citycode", "")
+    if any(key.startswith(prefix) for key in helper.filters):
+        return  # Already filtered by the caller.
+    trie = get_trie()
+    if trie is None:
+        return
+    words = sorted(helper.tokens, key=lambda token: token.position)
+    # A postcode tells which of the homonym cities it is.
+    postcode_prefix = keys.filter_key("postcode", "")
+    departments = {
+        department_of(key[len(postcode_prefix):])
+        for key in helper.filters
+        if key.startswith(postcode_prefix)
+    }
+    while words and is_postcode(words[-1]):
+        departments.add(department_of(words.pop()))
+    found = trie.match(words)
+    if found is None:
+        return
+    start, citycodes = found
+    if not start or words[start - 1] in CONNECTORS or is_street_type(words[start - 1]):
+        return
+    if departments:
+        citycodes = [c for c in citycodes if department_of(c) in departments]
+    if len(citycodes) != 1:
+        return
+    key = keys.filter_key("citycode", citycodes[0])
+    # Only citycodes of the indexed documents are real ones.
+    if DB.exists(key):
+        helper.debug("City filter: %s", citycodes[0])
+        helper.filters.append(key)
+        city = {id(token) for token in words[start:]}
+        helper.tokens = [t for t in helper.tokens if id(t) not in city]
+
+
+@config.on_load
+def on_load():
+    # Build the trie before the workers are forked.
+    if city_filter in (config.SEARCH_PREPROCESSORS or []):
+        get_trie()
@@ -0,0 +1,179 @@
+"""
+Guess the department(s) of a query, to route it in a deployment sharded by
+department.
+
+Evidence, by decreasing weight: postcodes, CEDEX codes, known city names
+(from the CSV file set in FRANCE_CITIES_PATH, a name and a citycode per row),
+a department number right before a city of this department (as output by
+clean_query for CEDEX addresses: "31 TOULOUSE").
+"""
+import csv
+import re
+
+from addok.config import config
+from addok.helpers.text import ascii
+
+from . import cedex, utils
+from .postcodes import is_postcode
+
+POSTCODE_WEIGHT = 1.0
+CITY_WEIGHT = 0.8
+# Street names often contain city names ("rue de Paris"): the city is usually
+# the last one in the query.
+OTHER_CITY_WEIGHT = 0.3
+# Max number of words of a city name.
+CITY_MAX_WORDS = 6
+
+BP_PATTERN = utils.CLEAN_COMPILED[utils.CLEAN_NAMES.index("bp")][0]
+CEDEX_PATTERN = utils.LazyPattern(r"c[eé]dex", flags=re.IGNORECASE)
+CODE_PATTERN = utils.LazyPattern(r"\b\d{5}\b")
+WORD_PATTERN = utils.LazyPattern(r"\w+")
+CITYCODE_PATTERN = utils.LazyPattern(r"^\d[\dab]\d{3}$", flags=re.IGNORECASE)
+
+# Path => {name: departments}.
+_CITIES = {}
+
+
+def department_of(code):
+    """Return the department of a postcode or a citycode."""
+    code = code.upper()
+    if code.startswith(("97", "98")):
+        return code[:3]
+    if code.startswith("2A") or code.startswith("2B"):
+        return code[:2]
+    if code.startswith("20") and code.isdigit():
+        # Corsica postcodes: 200xx and 201xx for Corse-du-Sud.
+        return "2A" if code < "20200" else "2B"
+    return code[:2]
+
+
+def city_key(name):
+    return " ".join(WORD_PATTERN.findall(ascii(name)))
+
+
+def read_cities(path):
+    """Yield the (name, citycode) rows of a cities CSV file."""
+    with open(path, newline="") as f:
+        first = f.readline()
+        f.seek(0)
+        delimiter = next((d for d in ";\t" if d in first), ",")
+        for row in csv.reader(f, delimiter=delimiter):
+            if len(row) >= 2 and CITYCODE_PATTERN.match(row[1]):
+                yield row[0], row[1].upper()
+
+
+def load_cities(path):
+    cities = {}
+    for name, citycode in read_cities(path):
+        departments = cities.setdefault(city_key(name), [])
+        department = department_of(citycode)
+        if department not in departments:
+            departments.append(department)
+    return {name: tuple(departments) for name, departments in cities.items()}
+
+
+def get_cities():
+    path = config.FRANCE_CITIES_PATH
+    if not path:
+        return {}
+    cities = _CITIES.get(path)
+    if cities is None:
+        cities = _CITIES[path] = load_cities(path)
+    return cities
+
+
+def find_cities(words, cities):
+    """Yield (start, departments) of the city names found in `words`.
+
+    Longest names win, matches do not overlap.
+    """
+    start = 0
+    while start < len(words):
+        for end in range(min(len(words), start + CITY_MAX_WORDS), start, -1):
+            departments = cities.get(" ".join(words[start:end]))
+            if departments:
+                yield start, departments
+                start = end
+                break
+        else:
+            start += 1
+
+
+def routing_hint(query):
+    """
+    Return the departments of a query, by decreasing score, with:
+    - confidence: from 0 (no idea) to 1 (one department, strong evidence);
+    - broadcast: whether the query should be sent to all the shards, when
+      confidence is below FRANCE_ROUTING_MIN_CONFIDENCE.
+    """
+    scores = {}
+
+    def add(department, weight):
+        scores[department] = scores.get(department, 0) + weight
+
+    query = BP_PATTERN.sub(" ", query)
+    # Codes before a "cedex" are CEDEX codes. Only look for the last one, a
+    # lookahead per code would rescan the rest of the query each time.
+    last_cedex = max((m.start() for m in CEDEX_PATTERN.finditer(query)), default=-1)
+    cedex_codes = set()
+    codes = []
+    for match in CODE_PATTERN.finditer(query):
+        code = match.group()
+        if match.end() <= last_cedex:
+            cedex_codes.add(code)
+            add(department_of(cedex.resolve(code) or code), POSTCODE_WEIGHT)
+        else:
+            codes.append(code)
+    for code in codes:
+        if code not in cedex_codes and is_postcode(code):
+            add(department_of(code), POSTCODE_WEIGHT)
+    words = WORD_PATTERN.findall(ascii(query))
+    matches = list(find_cities(words, get_cities()))
+    for index, (start, departments) in enumerate(matches):
+        previous = words[start - 1].upper() if start else ""
+        if previous in departments:
+            add(previous, POSTCODE_WEIGHT)
+            continue
+        # A postcode tells which of the homonym cities it is.
+        departments = [d for d in departments if d in scores] or departments
+        weight = CITY_WEIGHT if index == len(matches) - 1 else OTHER_CITY_WEIGHT
+        for department in departments:
+            add(department, weight / len(departments))
+    departments = sorted(scores, key=scores.get, reverse=True)
+    confidence = 0.0
+    if departments:
+        top = scores[departments[0]]
+        confidence = round(top / sum(scores.values()) * min(top, 1.0), 3)
+    minimum = config.FRANCE_ROUTING_MIN_CONFIDENCE
+    if minimum is None:
+        minimum = 0.5
+    return {
+        "departments": departments,
+        "confidence": confidence,
+        "broadcast": confidence < minimum,
+    }
+
+
+def department_hint(helper):
+    """Search preprocessor annotating the helper with its routing hint."""
+    helper.department_hint = routing_hint(helper.query)
+    helper.debug("Department hint: %s", helper.department_hint)
+
+
+def register_http_endpoint(api):
+    import falcon
+    from addok.helpers.text import EntityTooLarge, check_query_length
+    from addok.http.base import View
+
+    class RoutingHint(View):
+        def on_get(self, req, resp):
+            query = req.get_param("q")
+            if not query:
+                raise falcon.HTTPMissingParam("q")
+            try:
+                next(check_query_length([query]))
+            except EntityTooLarge as e:
+                raise falcon.HTTPContentTooLarge(title=str(e))
+            self.json(req, resp, dict(routing_hint(query), query=query))
+
+    api.add_route("/france/route", RoutingHint())
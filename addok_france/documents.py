@@ -0,0 +1,94 @@
+"""
+Prepare documents (NDJSON, eg. from the BAN) before indexing them.
+
+    addok france-preprocess ban.ndjson --output prepared.ndjson
+    addok batch prepared.ndjson
+
+Housenumbers are tokenized (ordinals glued and folded) and labels computed
+across a process pool, by bounded chunks, so memory stays flat whatever the
+size of the input. Use addok_france.prepare_housenumbers in BATCH_PROCESSORS
+for the indexer not to prepare the housenumbers again.
+"""
+import json
+import sys
+
+from addok.config import config
+from addok.helpers import index
+
+from . import utils
+from .batch import imap_chunks
+
+
+def is_prepared(doc):
+    housenumbers = doc.get(config.HOUSENUMBERS_FIELD)
+    return bool(housenumbers) and all(
+        isinstance(data, dict) and "raw" in data for data in housenumbers.values()
+    )
+
+
+def prepare_housenumbers(doc):
+    """Same as addok's prepare_housenumbers, unless already done."""
+    if doc and is_prepared(doc):
+        return doc
+    return next(index.prepare_housenumbers([doc]))
+
+
+def prepare_document(doc):
+    return utils.prepare_labels(prepare_housenumbers(doc))
+
+
+def prepare_lines(lines):
+    prepared = []
+    for line in lines:
+        try:
+            doc = json.loads(line)
+        except ValueError:
+            continue
+        if not doc:
+            continue
+        prepared.append(json.dumps(prepare_document(doc), ensure_ascii=False))
+    return prepared
+
+
+def prepare_file(f, output, chunksize=1000, workers=None, method=None):
+    """Write the prepared documents of `f` to `output`, in input order."""
+    count = 0
+    for lines in imap_chunks(prepare_lines, f, chunksize, workers, method):
+        for line in lines:
+            output.write(line + "\n")
+        count += len(lines)
+    return count
+
+
+def register_command(subparsers):
+    parser = subparsers.add_parser(
+        "france-preprocess", help="Prepare NDJSON documents before indexing"
+    )
+    parser.add_argument("filepath", nargs="?", help="NDJSON file (default: stdin)")
+    parser.add_argument("--output", help="Output NDJSON file (default: stdout)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Number of processes (default: BATCH_WORKERS)",
+    )
+    parser.add_argument(
+        "--chunksize", type=int, help="Documents sent at once to a worker"
+    )
+    parser.set_defaults(func=run)
+
+
+def run(args):
+    f = open(args.filepath) if args.filepath else sys.stdin
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        prepare_file(
+            f,
+            output,
+            args.chunksize or config.BATCH_CHUNK_SIZE,
+            args.workers or config.BATCH_WORKERS,
+        )
+    finally:
+        if args.filepath:
+            f.close()
+        if args.output:
+            output.close()
@@ -0,0 +1,178 @@
+"""
+Store housenumbers compactly, and match them at search time.
+
+The same data keys ("lat", "lon", "raw") appear millions of times in a full
+import: CompactSerializer stores the housenumbers of a document as columns
+(one list per data key), instead of one dict per housenumber.
+
+CompactSerializer also stores the housenumbers sorted by number, with their
+numbers, so that match_housenumber can find the closest one when the queried
+one does not exist ("3b" => "3") with a binary search.
+"""
+import json
+import zlib
+from bisect import bisect_left
+
+from addok.config import config
+from addok.helpers.serializers import ZlibSerializer
+
+from .utils import FOLD, LazyPattern
+
+
+def can_pack(housenumbers):
+    return all(
+        "raw" in data and None not in data.values() for data in housenumbers.values()
+    )
+
+
+def pack(housenumbers):
+    """{token: {key: value}} => [tokens, {key: values}, numbers].
+
+    Tokens are sorted by number then ordinal (see `build_index`), the ones
+    without a number last, and `numbers` are the numbers of the others, so
+    match_housenumber can bisect them. Raw values equal to their token (the
+    most common case) are not stored.
+    """
+    numbers, tokens = build_index(housenumbers)
+    if len(tokens) < len(housenumbers):
+        numbered = set(tokens)
+        tokens += [token for token in housenumbers if token not in numbered]
+    columns = {}
+    for index, token in enumerate(tokens):
+        for key, value in housenumbers[token].items():
+            if key == "raw" and value == token:
+                continue
+            column = columns.get(key)
+            if column is None:
+                column = columns[key] = [None] * len(tokens)
+            column[index] = value
+    return [tokens, columns, numbers]
+
+
+class Housenumbers(dict):
+    """Unpacked housenumbers, with their sorted index (see `build_index`)."""
+
+    index = None
+
+
+def unpack(packed):
+    tokens, columns = packed[:2]
+    raws = columns.get("raw") or [None] * len(tokens)
+    housenumbers = Housenumbers()
+    for index, token in enumerate(tokens):
+        data = {
+            key: values[index]
+            for key, values in columns.items()
+            if key != "raw" and values[index] is not None
+        }
+        data["raw"] = raws[index] if raws[index] is not None else token
+        housenumbers[token] = data
+    if len(packed) > 2:  # Not stored by previous versions.
+        housenumbers.index = [packed[2], tokens]
+    return housenumbers
+
+
+class CompactSerializer(ZlibSerializer):
+    """ZlibSerializer storing prepared housenumbers as columns."""
+
+    @classmethod
+    def dumps(cls, data):
+        field = config.HOUSENUMBERS_FIELD
+        housenumbers = data.get(field)
+        if housenumbers and can_pack(housenumbers):
+            data = dict(data, **{field: pack(housenumbers)})
+        return zlib.compress(json.dumps(data).encode())
+
+    @classmethod
+    def loads(cls, data):
+        doc = json.loads(zlib.decompress(data).decode())
+        field = config.HOUSENUMBERS_FIELD
+        if isinstance(doc.get(field), list):
+            doc[field] = unpack(doc[field])
+        return doc
+
+
+# Rank of the folded ordinals (see utils.FOLD): 3, 3b, 3t, 3q…
+ORDINALS = {ordinal: rank for rank, ordinal in enumerate(FOLD.values(), 1)}
+NUMBER_PATTERN = LazyPattern(r"(\d+)(.*)")
+
+
+def sort_key(token):
+    """Return (number, ordinal rank, ordinal) of a token, if it has a number."""
+    match = NUMBER_PATTERN.fullmatch(token)
+    if match is None:
+        return None
+    number, ordinal = match.groups()
+    rank = ORDINALS.get(ordinal, len(ORDINALS) + 1) if ordinal else 0
+    return int(number), rank, ordinal
+
+
+def build_index(tokens):
+    """Return [numbers, tokens], sorted by number then ordinal.
+
+    Tokens without a number are left out.
+    """
+    keyed = sorted(
+        (key, token) for token in tokens for key in [sort_key(token)] if key
+    )
+    return [[key[0] for key, _ in keyed], [token for _, token in keyed]]
+
+
+def closest(index, token, max_distance=0):
+    """Return the indexed token closest to `token`.
+
+    That is the first one with the same number ("3" or else "3b" for "3t"),
+    or else the first one with the nearest number, if at most `max_distance`
+    away (the lower one on a tie).
+    """
+    key = sort_key(token)
+    if key is None:
+        return None
+    numbers, tokens = index
+    number = key[0]
+    position = bisect_left(numbers, number)
+    if position < len(numbers) and numbers[position] == number:
+        return tokens[position]
+    best = None
+    if position:
+        lower = numbers[position - 1]
+        if number - lower <= max_distance:
+            best = number - lower, bisect_left(numbers, lower)
+    if position < len(numbers):
+        distance = numbers[position] - number
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = distance, position
+    return tokens[best[1]] if best else None
+
+
+def match_housenumber(helper, result):
+    """Same as addok.helpers.results.match_housenumber, with a fallback.
+
+    When the queried housenumber does not exist, the closest one is used (see
+    `closest`), within FRANCE_HOUSENUMBER_MAX_DISTANCE. When it is None, only
+    exact matches are used, as addok does.
+    """
+    if not helper.check_housenumber:
+        return
+    # Same tokens as addok.helpers.index.prepare_housenumbers.
+    raw = "".join(sorted(helper.housenumbers, key=lambda t: t.position))
+    housenumbers = result.housenumbers
+    if raw and housenumbers:
+        token = raw if raw in housenumbers else None
+        max_distance = config.FRANCE_HOUSENUMBER_MAX_DISTANCE
+        if token is None and max_distance is not None:
+            # Sorted at query time if not stored by CompactSerializer.
+            index = getattr(housenumbers, "index", None) or build_index(housenumbers)
+            token = closest(index, raw, max_distance)
+            if token is not None:
+                helper.debug("Housenumber %s not found, using %s", raw, token)
+        if token is not None:
+            data = dict(housenumbers[token])
+            result.housenumber = data.pop("raw")
+            result.type = "housenumber"
+            result.update(data)
+    if helper.only_housenumber and not result.housenumber:
+        helper.debug(
+            "Cannot match housenumber (%s), removing `%s`", result.housenumber, result
+        )
+        return False
@@ -0,0 +1,176 @@
+"""
+Reindex only the documents which changed since the previous import.
+
+    addok batch ban.ndjson
+    addok france-prune
+
+Add the two document processors to BATCH_PROCESSORS_PYPATHS, once the
+documents are prepared and before they are stored, and at the end:
+
+    "addok_france.skip_unchanged",
+    "addok.ds.store_documents",
+    "addok.helpers.index.index_documents",
+    "addok_france.store_hashes",
+
+skip_unchanged hashes each document as it would be stored, along with the
+processors and the plugin version, and drops the ones with the same hash as on
+the previous import (unless FRANCE_REINDEX_FORCE is set). A document with a new hash has
+its previous version deindexed first, so no stale token is left. After the
+import, france-prune removes the documents which were not in it.
+Documents with an "_action" are not skipped, their hash is updated (or
+removed, on delete). Only documents with an ID_FIELD are tracked.
+"""
+import hashlib
+import importlib
+import json
+
+from addok.config import config
+from addok.db import DB
+from addok.ds import DS, get_document
+from addok.helpers import keys
+from addok.helpers.index import deindex_document
+
+# Document id => hash of its stored version.
+HASHES_KEY = "france|hashes"
+# Ids of the documents seen since the last prune.
+SEEN_KEY = "france|seen"
+
+# Hashes of the documents between skip_unchanged and store_hashes.
+_PENDING = {}
+
+
+def register_command(subparsers):
+    parser = subparsers.add_parser(
+        "france-prune",
+        help="Remove the documents missing from the imports since the last prune",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only count them"
+    )
+    parser.set_defaults(func=run)
+
+
+def _name(func):
+    return "{}.{}".format(
+        getattr(func, "__module__", None),
+        getattr(func, "__qualname__", None) or type(func).__qualname__,
+    )
+
+
+def fingerprint():
+    """Return what, besides the document, changes the indexed data.
+
+    That is the processors and indexers in use, and the plugin version: a
+    document imported with other ones is not unchanged.
+    """
+    # Not at module level: the package imports us.
+    package = importlib.import_module(__package__)
+    names = [str(getattr(package, "VERSION", None))]
+    for setting in ("PROCESSORS", "BATCH_PROCESSORS", "INDEXERS"):
+        processors = getattr(config, setting, None) or []
+        names.append(",".join(_name(p) for p in processors))
+    return "|".join(names)
+
+
+def document_hash(doc, fingerprint=""):
+    data = {key: value for key, value in doc.items() if key != "_action"}
+    blob = fingerprint + json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(blob.encode(), digest_size=16).hexdigest()
+
+
+def skip_unchanged(docs):
+    docs = [doc for doc in docs if doc]
+    ids = [
+        str(doc[config.ID_FIELD]) if doc.get(config.ID_FIELD) is not None else None
+        for doc in docs
+    ]
+    known = [id_ for id_ in ids if id_ is not None]
+    stored = {}
+    if known:
+        DB.sadd(SEEN_KEY, *known)
+        stored = dict(zip(known, DB.hmget(HASHES_KEY, known)))
+    salt = fingerprint()
+    for doc, id_ in zip(docs, ids):
+        if id_ is None:
+            yield doc  # Untracked.
+            continue
+        action = doc.get("_action")
+        if action is not None:
+            # Handled by index_documents, store_hashes removes deleted ones.
+            if action in ("index", "update"):
+                _PENDING[id_] = document_hash(doc, salt)
+            yield doc
+            continue
+        hash_ = document_hash(doc, salt)
+        previous = stored[id_]
+        if previous is not None:
+            if previous.decode() == hash_ and not config.FRANCE_REINDEX_FORCE:
+                continue
+            # index_documents only deindexes documents with an "update" action.
+            known_doc = get_document(keys.document_key(id_))
+            if known_doc:
+                deindex_document(known_doc)
+        _PENDING[id_] = hash_
+        yield doc
+
+
+def store_hashes(docs):
+    pipe = DB.pipeline(transaction=False)
+    for doc in docs:
+        if doc and doc.get(config.ID_FIELD) is not None:
+            id_ = str(doc[config.ID_FIELD])
+            if doc.get("_action") == "delete":
+                pipe.hdel(HASHES_KEY, id_)
+            elif id_ in _PENDING:
+                pipe.hset(HASHES_KEY, id_, _PENDING.pop(id_))
+        yield doc
+    pipe.execute()
+
+
+def stale_ids(chunk_size=1000):
+    """Yield the ids of the tracked documents not seen since the last prune."""
+    ids = []
+    for id_ in DB.hscan_iter(HASHES_KEY, count=chunk_size):
+        ids.append(id_[0])
+        if len(ids) >= chunk_size:
+            yield from _unseen(ids)
+            ids = []
+    yield from _unseen(ids)
+
+
+def _unseen(ids):
+    if not ids:
+        return
+    pipe = DB.pipeline(transaction=False)
+    for id_ in ids:
+        pipe.sismember(SEEN_KEY, id_)
+    for id_, seen in zip(ids, pipe.execute()):
+        if not seen:
+            yield id_.decode()
+
+
+def prune(dry_run=False):
+    """Remove the tracked documents not seen since the last prune.
+
+    Return their number. Nothing is removed if no document was seen, as
+    nothing was imported.
+    """
+    if not DB.exists(SEEN_KEY):
+        return 0
+    # Consume the scan before removing anything.
+    stale = list(stale_ids())
+    if not dry_run:
+        for id_ in stale:
+            key = keys.document_key(id_)
+            doc = get_document(key)
+            if doc:
+                deindex_document(doc)
+                DS.remove(key)
+            DB.hdel(HASHES_KEY, id_)
+        DB.delete(SEEN_KEY)
+    return len(stale)
+
+
+def run(args):
+    count = prune(args.dry_run)
+    print("{} documents {}.".format(count, "to remove" if args.dry_run else "removed"))
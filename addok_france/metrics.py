@@ -0,0 +1,133 @@
+"""
+Opt-in instrumentation of the France processors.
+
+When FRANCE_METRICS is set, the France processors found in the configured
+pipelines are replaced by wrappers recording their calls and cumulative time,
+and clean_query and normalize_query count the hits of each CLEAN_PATTERNS
+rule (only when they run: queries served from the query cache are not
+counted again). Nothing is wrapped otherwise.
+"""
+import os
+from functools import wraps
+from time import perf_counter
+
+from addok.config import config
+
+from . import utils
+
+# Processor name => [calls, seconds], for this process.
+PROCESSORS = {}
+RULES = dict.fromkeys(utils.CLEAN_NAMES, 0)
+
+PIPELINES = [
+    "QUERY_PROCESSORS",
+    "PROCESSORS",
+    "BATCH_PROCESSORS",
+    "SEARCH_RESULT_PROCESSORS",
+    "REVERSE_RESULT_PROCESSORS",
+]
+# Pipelines where processors are called with (helper, result).
+RESULT_PIPELINES = ["SEARCH_RESULT_PROCESSORS", "REVERSE_RESULT_PROCESSORS"]
+_DONE = object()
+
+
+def timed_pipe(func, name):
+    counters = PROCESSORS.setdefault(name, [0, 0.0])
+
+    @wraps(func)
+    def wrapper(pipe):
+        # Only count the time spent in func: neither in the previous
+        # processors, pulled by func, nor in the next ones, pulling from us.
+        upstream = 0.0
+
+        def source():
+            nonlocal upstream
+            iterator = iter(pipe)
+            while True:
+                start = perf_counter()
+                item = next(iterator, _DONE)
+                upstream += perf_counter() - start
+                if item is _DONE:
+                    return
+                yield item
+
+        elapsed = 0.0
+        try:
+            start = perf_counter()
+            items = iter(func(source()))
+            while True:
+                item = next(items, _DONE)
+                elapsed += perf_counter() - start
+                if item is _DONE:
+                    return
+                yield item
+                start = perf_counter()
+        finally:
+            counters[0] += 1
+            counters[1] += elapsed - upstream
+
+    return wrapper
+
+
+def timed(func, name):
+    counters = PROCESSORS.setdefault(name, [0, 0.0])
+
+    @wraps(func)
+    def wrapper(*args):
+        start = perf_counter()
+        try:
+            return func(*args)
+        finally:
+            counters[1] += perf_counter() - start
+            counters[0] += 1
+
+    return wrapper
+
+
+def instrument(config):
+    """Wrap the France processors of the configured pipelines."""
+    import addok_france
+
+    utils.RULE_HITS = RULES
+    names = {
+        getattr(addok_france, name): name
+        for name in dir(addok_france)
+        if callable(getattr(addok_france, name))
+    }
+    for pipeline in PIPELINES:
+        processors = []
+        for processor in getattr(config, pipeline) or []:
+            name = names.get(processor)
+            if name is not None:
+                wrap = timed if pipeline in RESULT_PIPELINES else timed_pipe
+                processor = wrap(processor, name)
+            processors.append(processor)
+        setattr(config, pipeline, processors)
+
+
+@config.on_load
+def on_load():
+    if config.FRANCE_METRICS:
+        instrument(config)
+
+
+def snapshot():
+    """Return a copy of the counters of this process."""
+    return {
+        "processors": {
+            name: {"calls": calls, "time": seconds}
+            for name, (calls, seconds) in PROCESSORS.items()
+        },
+        "rules": dict(RULES),
+    }
+
+
+def reset():
+    for counters in PROCESSORS.values():
+        counters[:] = [0, 0.0]
+    for name in RULES:
+        RULES[name] = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset)
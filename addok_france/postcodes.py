@@ -0,0 +1,89 @@
+"""
+Turn a postcode found in the query into a `postcode` filter.
+
+Add to SEARCH_PREPROCESSORS_PYPATHS, right after addok.helpers.search.tokenize:
+
+    "addok_france.postcode_filter",
+
+The filter narrows the candidates before any scoring, so a query mentioning a
+postcode only retrieves documents with this postcode. The postcodes of the
+housenumbers are indexed as filters of their document too (see
+HousenumberPostcodesIndexer, added to INDEXERS along with postcode_filter).
+"""
+from addok.config import config
+from addok.db import DB
+from addok.helpers import keys
+from addok.helpers.index import check_type_and_transform_to_array
+
+from .utils import LazyPattern
+
+# French postcodes: metropolitan departments (Corsica is 20xxx), overseas
+# departments and territories, and Monaco.
+POSTCODE_PATTERN = LazyPattern(r"(?:0[1-9]|[1-8]\d|9[0-5]|97[1-8]|98[06-8])\d+")
+
+
+def is_postcode(s):
+    """Tell whether `s` is shaped like an existing French postcode."""
+    return len(s) == 5 and POSTCODE_PATTERN.fullmatch(s) is not None
+
+
+def postcode_filter(helper):
+    if "postcode" not in config.FILTERS or len(helper.tokens) < 2:
+        return
+    prefix = keys.filter_key("postcode", "")
+    if any(key.startswith(prefix) for key in helper.filters):
+        return  # Already filtered by the caller.
+    for token in helper.tokens:
+        if token.kind == "housenumber" or not is_postcode(token):
+            continue
+        key = keys.filter_key("postcode", token)
+        # Only postcodes of the indexed documents are real ones.
+        if DB.exists(key):
+            helper.debug("Postcode filter: %s", token)
+            helper.filters.append(key)
+            helper.tokens.remove(token)
+            return
+
+
+class HousenumberPostcodesIndexer:
+    """Index the postcodes of the housenumbers as postcode filters.
+
+    addok only indexes the postcode of the document: the housenumbers of a
+    street with a postcode of their own would be filtered out.
+    """
+
+    @staticmethod
+    def postcodes(doc):
+        if "postcode" not in config.FILTERS or not config.HOUSENUMBERS_FIELD:
+            return set()
+        housenumbers = doc.get(config.HOUSENUMBERS_FIELD) or {}
+        postcodes = {
+            str(data["postcode"])
+            for data in housenumbers.values()
+            if isinstance(data, dict) and data.get("postcode")
+        }
+        # Those are indexed by FiltersIndexer.
+        own = doc.get("postcode")
+        if own:
+            own = check_type_and_transform_to_array("postcode", own)
+            postcodes -= {str(postcode) for postcode in own}
+        return postcodes
+
+    @classmethod
+    def index(cls, pipe, key, doc, tokens, **kwargs):
+        for postcode in cls.postcodes(doc):
+            pipe.sadd(keys.filter_key("postcode", postcode), key)
+
+    @classmethod
+    def deindex(cls, db, key, doc, tokens, **kwargs):
+        for postcode in cls.postcodes(doc):
+            db.srem(keys.filter_key("postcode", postcode), key)
+
+
+@config.on_load
+def on_load():
+    # Without it, postcode_filter would lose housenumbers.
+    if postcode_filter in (config.SEARCH_PREPROCESSORS or []) and (
+        HousenumberPostcodesIndexer not in config.INDEXERS
+    ):
+        config.INDEXERS = config.INDEXERS + [HousenumberPostcodesIndexer]
@@ -0,0 +1,153 @@
+"""
+Replay a query log through the configured query and token processors.
+
+    addok france-replay queries.txt
+    addok france-replay access.csv --column q --output normalized.txt
+"""
+import csv
+import math
+import sys
+import time
+from array import array
+
+from addok.config import config
+from addok.helpers.text import ascii
+
+
+def register_command(subparsers):
+    parser = subparsers.add_parser(
+        "france-replay",
+        help="Replay a query log through the query and token processors",
+    )
+    parser.add_argument("filepath", nargs="?", help="Query log (default: stdin)")
+    parser.add_argument(
+        "--column", help="Read queries from this column of a CSV log"
+    )
+    parser.add_argument("--delimiter", default=",", help="CSV delimiter")
+    parser.add_argument(
+        "--output", help="Write the processed tokens of each query to this file"
+    )
+    parser.set_defaults(func=run)
+
+
+def read_queries(f, column=None, delimiter=","):
+    """Yield the queries of a log, one per line or from a CSV column."""
+    if column:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            yield row.get(column) or ""
+    else:
+        for line in f:
+            yield line.rstrip("\r\n")
+
+
+def search_query(query):
+    """Return the query as addok.core.Search passes it to QUERY_PROCESSORS."""
+    return ascii(query.strip())
+
+
+def stage_name(processor):
+    # Processors may be instances, like shadow.Shadow.
+    name = getattr(processor, "__name__", type(processor).__name__)
+    return "{}.{}".format(processor.__module__, name)
+
+
+class Histogram:
+    """Counts of latencies (µs) by logarithmic buckets, in a fixed size.
+
+    Each bucket is GROWTH times wider than the previous one, so quantiles are
+    within 1% of the exact ones, from MIN µs to about 200 seconds.
+    """
+
+    MIN = 0.01
+    GROWTH = 1.02
+    SIZE = 1200
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * self.SIZE))
+        self.count = 0
+        self.total = 0.0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value <= self.MIN:
+            index = 0
+        else:
+            index = min(int(math.log(value / self.MIN, self.GROWTH)), self.SIZE - 1)
+        self.counts[index] += 1
+
+    def quantile(self, q):
+        """Return the latency below which the `q` share (0 to 1) of them are."""
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                # Geometric middle of the bucket.
+                return self.MIN * self.GROWTH ** (index + 0.5)
+        return 0.0
+
+
+def replay(queries, processors=None, output=None):
+    """Run each query through the processors, timing each stage.
+
+    Return (number of queries, total seconds, {stage: Histogram}).
+    """
+    if processors is None:
+        processors = config.QUERY_PROCESSORS + config.PROCESSORS
+    stages = [(stage_name(p), p, Histogram()) for p in processors]
+    count = 0
+    start = time.perf_counter()
+    for query in queries:
+        pipe = [search_query(query)]
+        for _, processor, latencies in stages:
+            before = time.perf_counter_ns()
+            pipe = list(processor(pipe))
+            latencies.add((time.perf_counter_ns() - before) / 1000)
+        if output is not None:
+            output.write(" ".join(pipe) + "\n")
+        count += 1
+    elapsed = time.perf_counter() - start
+    return count, elapsed, {name: latencies for name, _, latencies in stages}
+
+
+def report(count, elapsed, stages, out=None):
+    out = out or sys.stdout
+    rate = count / elapsed if elapsed else 0
+    print("{} queries in {:.2f}s ({:.0f} q/s)".format(count, elapsed, rate), file=out)
+    if count < 2:
+        return
+    print(
+        "{:<48} {:>8} {:>9} {:>9} {:>9}".format(
+            "stage", "share", "p50 µs", "p95 µs", "p99 µs"
+        ),
+        file=out,
+    )
+    total = sum(latencies.total for latencies in stages.values()) or 1
+    for name, latencies in stages.items():
+        print(
+            "{:<48} {:>7.1f}% {:>9.2f} {:>9.2f} {:>9.2f}".format(
+                name,
+                latencies.total / total * 100,
+                latencies.quantile(0.5),
+                latencies.quantile(0.95),
+                latencies.quantile(0.99),
+            ),
+            file=out,
+        )
+
+
+def run(args):
+    f = open(args.filepath, newline="") if args.filepath else sys.stdin
+    output = open(args.output, "w") if args.output else None
+    try:
+        queries = read_queries(f, args.column, args.delimiter)
+        report(*replay(queries, output=output))
+    finally:
+        if args.filepath:
+            f.close()
+        if output is not None:
+            output.close()
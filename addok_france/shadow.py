@@ -0,0 +1,204 @@
+"""
+Compare two chains of processors, output for output, on the same queries.
+
+    addok france-shadow queries.txt --candidate addok_france.normalize_query
+    addok france-shadow access.csv --column q --tokens \\
+        --candidate addok_france.normalize_query
+
+The reference chain defaults to QUERY_PROCESSORS (followed by PROCESSORS with
+--tokens). Every query for which the outputs differ is reported, with both
+outputs, and the command exits with an error if there is any.
+
+To run a candidate in shadow mode in a test deployment, set:
+
+    FRANCE_SHADOW_QUERY_PROCESSORS_PYPATHS = ["addok_france.normalize_query"]
+
+The configured QUERY_PROCESSORS keep answering; the candidate chain runs on
+each query too, and divergences are logged (logger "addok_france.shadow").
+"""
+import logging
+import sys
+import time
+from collections import deque, namedtuple
+
+from addok.config import config
+from addok.helpers import import_by_path, iter_pipe
+from addok.helpers.text import Token
+
+from .replay import read_queries, search_query, stage_name
+
+logger = logging.getLogger(__name__)
+
+Divergence = namedtuple("Divergence", ["query", "reference", "candidate"])
+
+
+def register_command(subparsers):
+    parser = subparsers.add_parser(
+        "france-shadow",
+        help="Compare the output and speed of two chains of query processors",
+    )
+    parser.add_argument("filepath", nargs="?", help="Query log (default: stdin)")
+    parser.add_argument(
+        "--column", help="Read queries from this column of a CSV log"
+    )
+    parser.add_argument("--delimiter", default=",", help="CSV delimiter")
+    parser.add_argument(
+        "--reference",
+        help="Comma separated processor paths (default: QUERY_PROCESSORS)",
+    )
+    parser.add_argument(
+        "--candidate", required=True, help="Comma separated processor paths"
+    )
+    parser.add_argument(
+        "--tokens",
+        action="store_true",
+        help="Run PROCESSORS after both chains, and compare the tokens",
+    )
+    parser.set_defaults(func=run)
+
+
+def output(item):
+    """Return what is compared of an item output by a chain.
+
+    The attributes of tokens which processors may change are compared too,
+    not only their string.
+    """
+    if isinstance(item, Token):
+        return (str(item), item.kind, item.raw, tuple(item.position), item.is_last)
+    return str(item)
+
+
+class Shadow:
+    """Run a candidate chain of processors next to a reference one.
+
+    Calling it runs both chains on each query and yields the reference output,
+    so it can replace a list of processors in a pipeline. At most `keep`
+    divergences are kept (all of them if None), `on_divergence` is called
+    with each of them.
+    """
+
+    def __init__(self, reference, candidate, keep=None, on_divergence=None):
+        self.reference = list(reference)
+        self.candidate = list(candidate)
+        self.on_divergence = on_divergence
+        self.divergences = deque(maxlen=keep)
+        self.diverged = 0
+        self.count = 0
+        # Nanoseconds spent in each chain.
+        self.reference_time = 0
+        self.candidate_time = 0
+
+    def __call__(self, pipe):
+        for query in pipe:
+            yield from self.run(query)
+
+    def _candidate(self, query):
+        try:
+            return [output(item) for item in iter_pipe(query, self.candidate)]
+        except Exception as e:
+            # Never break the reference chain, report the error as its output.
+            return "{}: {}".format(type(e).__name__, e)
+
+    def run(self, query):
+        """Return the reference output for `query`, checking the candidate."""
+        start = time.perf_counter_ns()
+        # Alternate which chain runs first, so caches warmed by one chain do
+        # not favour the other one.
+        if self.count % 2:
+            actual = self._candidate(query)
+            middle = time.perf_counter_ns()
+            expected = list(iter_pipe(query, self.reference))
+            self.candidate_time += middle - start
+            self.reference_time += time.perf_counter_ns() - middle
+        else:
+            expected = list(iter_pipe(query, self.reference))
+            middle = time.perf_counter_ns()
+            actual = self._candidate(query)
+            self.reference_time += middle - start
+            self.candidate_time += time.perf_counter_ns() - middle
+        self.count += 1
+        outputs = [output(item) for item in expected]
+        if outputs != actual:
+            divergence = Divergence(query, outputs, actual)
+            self.diverged += 1
+            self.divergences.append(divergence)
+            if self.on_divergence is not None:
+                self.on_divergence(divergence)
+        return expected
+
+    @property
+    def speedup(self):
+        """How many times faster the candidate is than the reference."""
+        return self.reference_time / self.candidate_time if self.candidate_time else 0
+
+
+def compare(queries, reference, candidate):
+    """Run each query through both chains, return the Shadow."""
+    shadow = Shadow(reference, candidate)
+    for query in queries:
+        shadow.run(query)
+    return shadow
+
+
+def report(shadow, out=None):
+    out = out or sys.stdout
+    for divergence in shadow.divergences:
+        print(divergence.query, file=out)
+        print("  - {}".format(divergence.reference), file=out)
+        print("  + {}".format(divergence.candidate), file=out)
+    for label, chain in [("reference", shadow.reference),
+                         ("candidate", shadow.candidate)]:
+        print("{}: {}".format(label, ", ".join(map(stage_name, chain))), file=out)
+    count = shadow.count or 1
+    print(
+        "{} queries, {} divergences; reference {:.2f} µs/query, candidate "
+        "{:.2f} µs/query (x{:.2f})".format(
+            shadow.count,
+            shadow.diverged,
+            shadow.reference_time / count / 1000,
+            shadow.candidate_time / count / 1000,
+            shadow.speedup,
+        ),
+        file=out,
+    )
+
+
+def processors(paths):
+    return [import_by_path(path.strip()) for path in paths.split(",")]
+
+
+def run(args):
+    reference = (
+        processors(args.reference) if args.reference else config.QUERY_PROCESSORS
+    )
+    candidate = processors(args.candidate)
+    if args.tokens:
+        reference = reference + config.PROCESSORS
+        candidate = candidate + config.PROCESSORS
+    f = open(args.filepath, newline="") if args.filepath else sys.stdin
+    try:
+        queries = read_queries(f, args.column, args.delimiter)
+        shadow = compare(map(search_query, queries), reference, candidate)
+    finally:
+        if args.filepath:
+            f.close()
+    report(shadow)
+    if shadow.diverged:
+        sys.exit(1)
+
+
+def log_divergence(divergence):
+    logger.warning("Shadow divergence for %r: %r != %r", *divergence)
+
+
+@config.on_load
+def on_load():
+    if config.FRANCE_SHADOW_QUERY_PROCESSORS:
+        config.QUERY_PROCESSORS = [
+            Shadow(
+                config.QUERY_PROCESSORS,
+                config.FRANCE_SHADOW_QUERY_PROCESSORS,
+                keep=100,
+                on_divergence=log_divergence,
+            )
+        ]
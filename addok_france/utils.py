@@ -1,4 +1,33 @@
 import re
+import unicodedata
+from itertools import islice
+
+from addok.config import config
+from addok.helpers.text import ascii, compare_ngrams
+
+from . import aliases, cedex
+
+
+class LazyPattern:
+    """A regular expression, compiled on first use.
+
+    Attributes are read from the compiled pattern once, then kept on the
+    instance, so `PATTERN.sub(…)` costs the same as with `re.compile`.
+    """
+
+    def __init__(self, pattern, flags=0):
+        self._args = pattern, flags
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = getattr(re.compile(*self._args), name)
+        setattr(self, name, value)
+        return value
+
+    def __repr__(self):
+        return "LazyPattern({!r}, {!r})".format(*self._args)
+
 
 TYPES = [
     "aer(odrome)?",
@@ -80,10 +109,18 @@ FOLD = {
     "sexies": "s",
 }
 
+# Document fields used to compute labels, and the one where prepare_labels
+# stores them.
+LABEL_FIELDS = ("name", "city", "postcode", "type")
+LABELS_FIELD = "_labels"
+# Where prepare_labels stores the signature of each label, and its size.
+SIGNATURES_FIELD = "_signatures"
+SIGNATURE_BITS = 128
+
 # Try to match address pattern when the search string contains extra info (for
 # example "22 rue des Fleurs 59350 Lille" will be extracted from
 # "XYZ Ets bâtiment B 22 rue des Fleurs 59350 Lille Cedex 23").
-EXTRACT_ADDRESS_PATTERN = re.compile(
+EXTRACT_ADDRESS_PATTERN = LazyPattern(
     r"(\b\d{1,4}( *("
     + ORDINAL_REGEX
     + "))?,? +("
@@ -92,26 +129,176 @@ EXTRACT_ADDRESS_PATTERN = re.compile(
     flags=re.IGNORECASE,
 )
 
+# EXTRACT_ADDRESS_PATTERN split in two, for extract_address: the number, and
+# what must follow it, anchored.
+NUMBER_START_PATTERN = LazyPattern(r"\b\d{1,4}(?!\d)")
+AFTER_NUMBER_PATTERN = LazyPattern(
+    r"( *(" + ORDINAL_REGEX + "))?,? +(" + TYPES_REGEX + ") ",
+    flags=re.IGNORECASE,
+)
+
 # Match "bis", "ter", "b", etc.
-ORDINAL_PATTERN = re.compile(r"\b(" + ORDINAL_REGEX + r")\b", flags=re.IGNORECASE)
+ORDINAL_PATTERN = LazyPattern(r"\b(" + ORDINAL_REGEX + r")\b", flags=re.IGNORECASE)
 
 # Match "rue", "boulevard", "bd", etc.
-TYPES_PATTERN = re.compile(r"\b(" + TYPES_REGEX + r")\b", flags=re.IGNORECASE)
+TYPES_PATTERN = LazyPattern(r"\b(" + TYPES_REGEX + r")\b", flags=re.IGNORECASE)
+
+
+def _expand(pattern):
+    """List every string matched by one of the TYPES patterns.
+
+    Only the syntax used by TYPES is supported: literals, `[…]` classes,
+    `(…|…)` groups and the `?` quantifier.
+    """
+    def parse(pos):
+        # Return the alternatives of the sequence starting at `pos`, and the
+        # position where it stops (end of pattern, "|" or ")").
+        alternatives = []
+        current = [""]
+        while pos < len(pattern) and pattern[pos] not in "|)":
+            char = pattern[pos]
+            if char == "(":
+                options, pos = parse(pos + 1)
+                while pattern[pos] == "|":
+                    more, pos = parse(pos + 1)
+                    options.extend(more)
+                pos += 1  # Closing parenthesis.
+            elif char == "[":
+                end = pattern.index("]", pos)
+                options = list(pattern[pos + 1 : end])
+                pos = end + 1
+            elif char in "\\.*+{}^$":
+                raise ValueError("Unsupported syntax in {!r}".format(pattern))
+            else:
+                options = [char]
+                pos += 1
+            if pos < len(pattern) and pattern[pos] == "?":
+                options = options + [""]
+                pos += 1
+            current = [prefix + option for prefix in current for option in options]
+        alternatives.extend(current)
+        return alternatives, pos
+
+    alternatives, pos = parse(0)
+    while pos < len(pattern) and pattern[pos] == "|":
+        more, pos = parse(pos + 1)
+        alternatives.extend(more)
+    return alternatives
+
+
+# Every spelling accepted by TYPES_PATTERN, lowercased.
+STREET_TYPES = frozenset(form for type_ in TYPES for form in _expand(type_))
+# Their non ASCII characters.
+STREET_TYPES_CHARS = frozenset(
+    c for form in STREET_TYPES for c in form if not c.isascii()
+)
+
+
+# Abbreviations of common words of street names, ascii folded.
+ABBREVIATIONS = {
+    "adj": "adjudant",
+    "cdt": "commandant",
+    "dr": "docteur",
+    "gal": "general",
+    "lt": "lieutenant",
+    "mal": "marechal",
+    "mgr": "monseigneur",
+    "pdt": "president",
+    "sgt": "sergent",
+    "st": "saint",
+    "ste": "sainte",
+    "sts": "saints",
+    "stes": "saintes",
+}
+# Forms matched by TYPES which are not mapped: words or names on their own
+# ("car", "lot", "ham" for the commune of Ham, "dom" for the title), forms of
+# several words ("anc": ancien or ancienne), of an unsure word ("grs", "pte":
+# porte or petite) or without a single word full form ("rpt": rond point).
+NOT_ABBREVIATIONS = {"anc", "car", "dom", "grs", "ham", "lot", "pte", "quart",
+                     "rpt", "sente"}
+
+
+def _fold(s):
+    return unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode()
+
+
+def _canonical_forms():
+    """Map each abbreviation of TYPES to the longest form of its type.
+
+    Plural and gender variants are kept as is ("allee", "allees"), as well as
+    single letters (initials, ordinals) and forms shared by several TYPES.
+    """
+    canonicals = {}
+    for type_ in TYPES:
+        forms = {_fold(form) for form in _expand(type_) if " " not in form}
+        canonical = max(sorted(forms), key=len)
+        if canonical.endswith("ees") or canonical.endswith("ges"):
+            canonical = canonical[:-1]  # Plural: allees => allee.
+        for form in forms:
+            canonicals.setdefault(form, set()).add(canonical)
+    mapping = {}
+    for form, candidates in canonicals.items():
+        if len(candidates) > 1 or len(form) < 2 or form in NOT_ABBREVIATIONS:
+            continue
+        canonical = candidates.pop()
+        shorter, longer = sorted([form, canonical], key=len)
+        if longer.startswith(shorter) and len(longer) - len(shorter) <= 2:
+            continue
+        mapping[form] = canonical
+    mapping.update(ABBREVIATIONS)
+    return mapping
+
+
+# Abbreviation => canonical form, used by canonicalize.
+CANONICAL_FORMS = _canonical_forms()
+
+
+def is_street_type(token):
+    """Tell whether `token` is a street type, like TYPES_PATTERN.match."""
+    lowered = token.lower()
+    if not lowered.isascii() and not STREET_TYPES_CHARS.issuperset(
+        c for c in lowered if not c.isascii()
+    ):
+        # IGNORECASE also matches characters which str.lower does not fold the
+        # same way, like "İ" => "i" or "ſ" => "s": leave those to the pattern.
+        return bool(TYPES_PATTERN.match(token))
+    token = lowered
+    if token in STREET_TYPES:
+        return True
+    if token.isalnum():
+        return False
+    # TYPES_PATTERN.match also accepts a street type followed by a word
+    # boundary, for example "rue-de".
+    for index in range(1, len(token)):
+        if (
+            _is_word(token[index - 1])
+            and not _is_word(token[index])
+            and token[:index] in STREET_TYPES
+        ):
+            return True
+    return False
 
 
 # Match number + ordinal, once glued by glue_ordinal (or typed like this in the
 # search string, for example "6bis", "234ter").
-FOLD_PATTERN = re.compile(r"^(\d{1,4})(" + ORDINAL_REGEX + ")$", flags=re.IGNORECASE)
+FOLD_PATTERN = LazyPattern(r"^(\d{1,4})(" + ORDINAL_REGEX + ")$", flags=re.IGNORECASE)
 
 
 # Match number once cleaned by glue_ordinal and fold_ordinal (for example
 # "6b", "234t"…)
-NUMBER_PATTERN = re.compile(r"\b\d{1,4}[a-z]?\b", flags=re.IGNORECASE)
+NUMBER_PATTERN = LazyPattern(r"\b\d{1,4}[a-z]?\b", flags=re.IGNORECASE)
+
+
+def resolve_cedex(match):
+    """Replace a CEDEX code by its postcode, or by its department prefix."""
+    code, department, rest = match.group(1, 2, 3)
+    return "{}{}".format(cedex.resolve(code) or department, rest)
+
 
 CLEAN_PATTERNS = (
     (r"([\d]{5})", r" \1 "),
     (r"(^| )(b\.?p\.?|cs|tsa|cidex) *(n(o|°|) *|)[\d]+ *", r"\1"),
-    (r"([\d]{2})[\d]{3}(.*)c(e|é)dex ?[\d]*", r"\1\2"),
+    (r"(([\d]{2})[\d]{3})(.*)c(e|é)dex ?[\d]*", resolve_cedex),
     (r"c(e|é)dex ?[\d]*", ""),
     (r"\d{,2}(e|[eè]me) ([eé]tage)", ""),
     (" {2,}", " "),
@@ -119,22 +306,191 @@ CLEAN_PATTERNS = (
     ("[ -]s/s[ -]", " sous "),
     ("^lieux?[ -]?dits?\\b(?=.)", ""),
 )
+# Name of each CLEAN_PATTERNS rule, for metrics.
+CLEAN_NAMES = (
+    "postcode",
+    "bp",
+    "cedex_postcode",
+    "cedex",
+    "etage",
+    "spaces",
+    "sur",
+    "sous",
+    "lieu_dit",
+)
+# Rule name => number of hits, counted by clean_query and normalize_query
+# when set (see metrics).
+RULE_HITS = None
 CLEAN_COMPILED = list(
-    (re.compile(pattern, flags=re.IGNORECASE), replacement)
+    (LazyPattern(pattern, flags=re.IGNORECASE), replacement)
     for pattern, replacement in CLEAN_PATTERNS
 )
+# Same, for clean_query_batch: "^" also matches at the start of each line, so
+# a rule can be applied at once to queries joined by newlines. Rules must not
+# match a newline.
+CLEAN_LINES_COMPILED = list(
+    LazyPattern(pattern, flags=re.IGNORECASE | re.MULTILINE)
+    for pattern, _ in CLEAN_PATTERNS
+)
+
+# Limit digits from 1 to 3 in order to avoid processing postcodes.
+LEADING_ZEROS_PATTERN = LazyPattern(r"\b0+(\d{1,3})\b", flags=re.IGNORECASE)
+
+# Used by normalize_query: digit runs and space runs are rewritten in place,
+# any other alternative means one of the rare CLEAN_PATTERNS rules (BP, CEDEX,
+# étage, s/, lieu-dit…) may apply, so we fall back to the full chain.
+NORMALIZE_PATTERN = LazyPattern(
+    r"(\d+)|( {2,})|b\.?p|cs|tsa|cidex|c[eé]dex|[eé]tage|s/|lieu",
+    flags=re.IGNORECASE,
+)
 
 
 def clean_query(q):
+    if RULE_HITS is not None:
+        return _clean_query_counting(q)
     for pattern, repl in CLEAN_COMPILED:
         q = pattern.sub(repl, q)
     q = q.strip()
     return q
 
 
+def _clean_query_counting(q):
+    # Same as clean_query, counting the hits of each rule in RULE_HITS.
+    for name, (pattern, repl) in zip(CLEAN_NAMES, CLEAN_COMPILED):
+        q, count = pattern.subn(repl, q)
+        if count:
+            RULE_HITS[name] += count
+    return q.strip()
+
+
+def clean_query_batch(queries):
+    """Same as `[clean_query(q) for q in queries]`, rule by rule.
+
+    Identical queries are cleaned once. The others are joined by newlines and
+    each rule is applied once to the whole chunk, as none of them matches a
+    newline. Queries with a newline of their own go through clean_query.
+    """
+    unique = list(dict.fromkeys(queries))
+    lines = [q for q in unique if "\n" not in q]
+    joined = "\n".join(lines)
+    for pattern, (_, repl) in zip(CLEAN_LINES_COMPILED, CLEAN_COMPILED):
+        joined = pattern.sub(repl, joined)
+    results = dict(zip(lines, (q.strip() for q in joined.split("\n"))))
+    for q in unique:
+        if "\n" in q:
+            results[q] = clean_query(q)
+    return [results[q] for q in queries]
+
+
+def _address_start(q, stop):
+    """Return where EXTRACT_ADDRESS_PATTERN would match in `q`, if it does.
+
+    Runs in linear time: each number is tried once, and what AFTER_NUMBER_PATTERN
+    reads (and backtracks on) after a number stops before the next number.
+    """
+    for match in NUMBER_START_PATTERN.finditer(q, 0, stop):
+        if AFTER_NUMBER_PATTERN.match(q, match.end()):
+            return match.start()
+    return None
+
+
 def extract_address(q):
-    m = EXTRACT_ADDRESS_PATTERN.search(q)
-    return m.group() if m else q
+    """Same as EXTRACT_ADDRESS_PATTERN.search, in linear time.
+
+    Only the first FRANCE_EXTRACT_MAX_LENGTH characters are searched for the
+    start of the address.
+    """
+    start = _address_start(q, min(len(q), config.FRANCE_EXTRACT_MAX_LENGTH or len(q)))
+    if start is None:
+        return q
+    end = q.find("\n", start)
+    return q[start:end] if end != -1 else q[start:]
+
+
+def extract_address_batch(queries):
+    """Same as `[extract_address(q) for q in queries]`.
+
+    Identical queries are processed once, and the config read once.
+    """
+    max_length = config.FRANCE_EXTRACT_MAX_LENGTH
+    results = {}
+    for q in queries:
+        if q in results:
+            continue
+        start = _address_start(q, min(len(q), max_length or len(q)))
+        if start is None:
+            results[q] = q
+        else:
+            end = q.find("\n", start)
+            results[q] = q[start:end] if end != -1 else q[start:]
+    return [results[q] for q in queries]
+
+
+class _NeedsFallback(Exception):
+    pass
+
+
+def _is_word(char):
+    # Same definition as `\w` for str patterns.
+    return char.isalnum() or char == "_"
+
+
+def _fold_leading_zeros(number):
+    # Same as remove_leading_zeros, for a number known to be a whole word.
+    if len(number) > 1 and number[0] == "0":
+        stripped = number.lstrip("0") or "0"
+        if len(stripped) <= 3:
+            return stripped
+    return number
+
+
+def _normalize_match(match):
+    number = match.group(1)
+    if number is None:
+        if match.group(2) is None:
+            raise _NeedsFallback
+        if RULE_HITS is not None:
+            RULE_HITS["spaces"] += 1
+        return " "
+    string, start, end = match.string, match.start(), match.end()
+    before = string[start - 1] if start else " "
+    after = string[end] if end < len(string) else " "
+    size = len(number)
+    if size < 5:
+        if _is_word(before) or _is_word(after):
+            return number
+        return _fold_leading_zeros(number)
+    # Postcode like runs are isolated by spaces, five digits at a time.
+    cut = size - size % 5
+    if RULE_HITS is not None:
+        RULE_HITS["postcode"] += cut // 5
+    chunks = [_fold_leading_zeros(number[i : i + 5]) for i in range(0, cut, 5)]
+    rest = number[cut:]
+    if rest:
+        chunks.append(rest if _is_word(after) else _fold_leading_zeros(rest))
+    elif after != " ":
+        chunks.append("")
+    if before != " ":
+        chunks.insert(0, "")
+    return " ".join(chunks)
+
+
+def normalize_query(q, clean=clean_query):
+    """Same as extract_address + clean_query + remove_leading_zeros.
+
+    Common queries are processed in a single pass over the string, only the
+    ones that may need one of the rare CLEAN_PATTERNS rules go through the
+    whole chain (using `clean` instead of clean_query).
+    """
+    q = extract_address(q)
+    if RULE_HITS is not None:
+        counted = {name: RULE_HITS[name] for name in ("postcode", "spaces")}
+    try:
+        return NORMALIZE_PATTERN.sub(_normalize_match, q).strip()
+    except _NeedsFallback:
+        if RULE_HITS is not None:
+            RULE_HITS.update(counted)  # Counted again by `clean`.
+        return remove_leading_zeros(clean(q))
 
 
 def neighborhood(iterable, first=None, last=None):
@@ -165,9 +521,7 @@ def glue_ordinal(tokens):
             continue
         if previous is not None:
             # Matches "bis" either followed by a type or nothing.
-            if ORDINAL_PATTERN.match(token) and (
-                not next_ or TYPES_PATTERN.match(next_)
-            ):
+            if ORDINAL_PATTERN.match(token) and (not next_ or is_street_type(next_)):
                 raw = "{} {}".format(previous, token)
                 # Space removed to maximize chances to get a hit.
                 token = previous.update(raw.replace(" ", ""), raw=raw)
@@ -183,7 +537,7 @@ def flag_housenumber(tokens):
     found = False
     for previous, token, next_ in neighborhood(tokens):
         if (
-            (token.is_first or (next_ and TYPES_PATTERN.match(next_)))
+            (token.is_first or (next_ and is_street_type(next_)))
             and NUMBER_PATTERN.match(token)
             and not found
         ):
@@ -192,76 +546,332 @@ def flag_housenumber(tokens):
         yield token
 
 
+def canonicalize(tokens):
+    """bd => boulevard, st => saint…
+
+    Must be used both at index and search time (PROCESSORS), after
+    synonymize, so that the configured synonyms come first.
+    """
+    for token in tokens:
+        canonical = CANONICAL_FORMS.get(token)
+        yield token.update(canonical) if canonical else token
+
+
 def fold_ordinal(s):
     """3bis => 3b."""
     if s[0].isdigit() and not s.isdigit():
-        try:
-            number, ordinal = FOLD_PATTERN.findall(s)[0]
-        except (IndexError, ValueError):
-            pass
-        else:
+        match = FOLD_PATTERN.match(s)
+        if match:
+            number, ordinal = match.groups()
             s = s.update("{}{}".format(number, FOLD.get(ordinal.lower(), ordinal)))
     return s
 
 
+def _glue_and_fold(number, ordinal):
+    # Same as glue_ordinal then fold_ordinal, with one Token update.
+    raw = "{} {}".format(number, ordinal)
+    folded = ordinal.lower()
+    if number.isdecimal() and (
+        folded in FOLD or (len(ordinal) == 1 and ordinal.isascii() and ordinal.isalpha())
+    ):
+        return number.update(number + FOLD.get(folded, ordinal), raw=raw)
+    return fold_ordinal(number.update(raw.replace(" ", ""), raw=raw))
+
+
+def housenumber_pipeline(tokens):
+    """Same as glue_ordinal + fold_ordinal + flag_housenumber, in one pass."""
+    tokens = list(tokens)
+    if not any(token[:1].isdigit() for token in tokens):
+        # Nothing to glue, fold nor flag.
+        yield from tokens
+        return
+    found = False
+    previous = None  # Number waiting for a possible ordinal.
+    pending = None  # Token waiting for the next one, to be flagged.
+    last = len(tokens) - 1
+    for index, token in enumerate(tokens):
+        next_ = tokens[index + 1] if index < last else None
+        if next_ and token.isdigit() and len(token) < 5:
+            previous = token
+            continue
+        if previous is not None:
+            if ORDINAL_PATTERN.match(token) and (not next_ or is_street_type(next_)):
+                token = _glue_and_fold(previous, token)
+            else:
+                # False positive, no need to fold a number.
+                if pending is not None:
+                    found = _flag(pending, previous, found)
+                    yield pending
+                pending = previous
+                token = fold_ordinal(token)
+            previous = None
+        else:
+            token = fold_ordinal(token)
+        if pending is not None:
+            found = _flag(pending, token, found)
+            yield pending
+        pending = token
+    if pending is not None:
+        _flag(pending, None, found)
+        yield pending
+
+
+def _flag(token, next_, found):
+    # Same as flag_housenumber, for one token; return whether a housenumber
+    # has been found so far.
+    if (
+        not found
+        and (token.is_first or (next_ and is_street_type(next_)))
+        and NUMBER_PATTERN.match(token)
+    ):
+        token.kind = "housenumber"
+        return True
+    return found
+
+
 def remove_leading_zeros(s):
     """0003 => 3."""
-    # Limit digits from 1 to 3 in order to avoid processing postcodes.
-    return re.sub(r"\b0+(\d{1,3})\b", "\g<1>", s, flags=re.IGNORECASE)
+    return LEADING_ZEROS_PATTERN.sub(r"\g<1>", s)
 
 
-def make_labels(helper, result):
+def _values(doc, key):
+    # Same as addok.core.Result._rawattr, for a raw document.
+    value = doc.get(key, "")
+    if not isinstance(value, (tuple, list)):
+        value = [value]
+    return value
+
+
+def iter_labels(names, cities, postcode, type_):
     """
-    Generate search labels for a result.
+    Yield unique search labels, without housenumber, by priority order.
 
     For addresses in merged municipalities (communes nouvelles), the city field
-    can be a list containing all valid city names (historical and new).
+    can be a list containing all valid city names (historical and new), or
+    the names can come from the FRANCE_CITY_ALIASES_PATH table (see aliases).
     This allows addresses to be found using any of their valid city names.
-
-    Labels are generated in priority order using insert(0), where the last-added
-    label appears first. This ordering is important for result scoring in addok.
     """
-    if result.labels:
-        return
-    housenumber = getattr(result, "housenumber", None)
-
-    def add(labels, label):
-        """
-        Add a label to the list, with insert(0) for priority ordering.
-        If housenumber is present, also adds the housenumber variant.
-        """
-        labels.insert(0, label)
-        if housenumber:
-            label = "{} {}".format(housenumber, label)
-            labels.insert(0, label)
-
-    # Support both single city (string) and merged municipalities (list)
-    raw_city = result._rawattr("city")
-    # Normalize to list: if list, use as-is; if empty list, treat as [None]; if scalar, wrap in list
-    if isinstance(raw_city, list):
-        cities = raw_city if raw_city else [None]
-    else:
-        cities = [raw_city]
-
-    postcode = result.postcode
-    names = result._rawattr("name")
-    if not isinstance(names, (list, tuple)):
-        names = [names]
-
+    # Empty city list is treated as no city at all.
+    cities = list(cities) or [None]
+    seen = set()
     # Generate labels for each name x city combination
     for name in names:
         for city in cities:
-            labels = []
+            # From the least to the most specific label.
+            combination = []
             label = name
-            if postcode and result.type == "municipality":
-                add(labels, "{} {}".format(label, postcode))
-                add(labels, "{} {}".format(postcode, label))
-            add(labels, label)
+            if postcode and type_ == "municipality":
+                combination.append("{} {}".format(label, postcode))
+                combination.append("{} {}".format(postcode, label))
+            combination.append(label)
             if city and city != label:
-                add(labels, "{} {}".format(label, city))
+                combination.append("{} {}".format(label, city))
                 if postcode:
                     label = "{} {}".format(label, postcode)
-                    add(labels, label)
+                    combination.append(label)
                     label = "{} {}".format(label, city)
-                    add(labels, label)
-            result.labels.extend(labels)
+                    combination.append(label)
+            for label in reversed(combination):
+                if label not in seen:
+                    seen.add(label)
+                    yield label
+
+
+def _with_housenumber(labels, housenumber):
+    # The housenumber variant of each label comes first.
+    seen = set()
+    for label in labels:
+        for variant in ("{} {}".format(housenumber, label), label):
+            if variant not in seen:
+                seen.add(variant)
+                yield variant
+
+
+def prepare_labels(doc):
+    """Store labels on the document at index time, for make_labels to use."""
+    if not doc or LABELS_FIELD in doc:
+        return doc  # Maybe prepared by france-preprocess.
+    housenumbers = doc.get(config.HOUSENUMBERS_FIELD) or {}
+    # A matched housenumber overrides the street fields: when it may change
+    # the labels, let make_labels compute them at search time.
+    if housenumbers and (
+        _values(doc, "type")[0] == "municipality"
+        or any(key in data for data in housenumbers.values() for key in LABEL_FIELDS)
+    ):
+        return doc
+    table = aliases.get_table()
+    if table is not None and table.get(doc.get("citycode")):
+        # Do not store the labels of the aliases, make_labels adds them.
+        return doc
+    labels = iter_labels(
+        _values(doc, "name"),
+        _values(doc, "city"),
+        _values(doc, "postcode")[0],
+        _values(doc, "type")[0],
+    )
+    doc[LABELS_FIELD] = list(islice(labels, config.FRANCE_LABELS_MAX or None))
+    if config.FRANCE_LABELS_SIGNATURES:
+        doc[SIGNATURES_FIELD] = [label_signature(label) for label in doc[LABELS_FIELD]]
+    return doc
+
+
+def _bigram_bits(text):
+    bits = 0
+    for left, right in zip(text, text[1:]):
+        bits |= 1 << ((ord(left) * 37 + ord(right)) % SIGNATURE_BITS)
+    return bits
+
+
+def label_signature(label):
+    """
+    Return [length, bigrams] of the label as compared by score_by_ngram_distance.
+
+    Bigrams are hashed into a SIGNATURE_BITS bitset. With the query bigrams,
+    it gives an upper bound of the score of the label, see _max_score.
+    """
+    label = ascii(label)
+    return [len(label), _bigram_bits(label)]
+
+
+def _housenumber_signature(signature, housenumber):
+    # Signature of "{housenumber} {label}", from the one of the label, plus
+    # the number of bigrams missing from it: the one across the space, as the
+    # first letter of the label is unknown.
+    housenumber = ascii(housenumber)
+    if not housenumber or not signature[0]:
+        return None
+    length, bits = signature
+    return (
+        len(housenumber) + 1 + length,
+        bits | _bigram_bits(housenumber + " "),
+        1,
+    )
+
+
+def iter_result_labels(result):
+    """
+    Yield the labels of a result by priority order, lazily.
+
+    Labels stored by prepare_labels are used when available. Labels are
+    unique, and capped to FRANCE_LABELS_MAX if set.
+    """
+    # Pop them so they are not exposed in the result properties.
+    labels = result._doc.pop(LABELS_FIELD, None)
+    signatures = result._doc.pop(SIGNATURES_FIELD, None)
+    if labels is not None and signatures is not None:
+        result._label_signatures = _signatures(
+            labels, signatures, getattr(result, "housenumber", None)
+        )
+    if labels is None:
+        labels = iter_labels(
+            result._rawattr("name"),
+            aliases.expand(result._rawattr("city"), result._doc.get("citycode")),
+            result.postcode,
+            result.type,
+        )
+    housenumber = getattr(result, "housenumber", None)
+    if housenumber:
+        labels = _with_housenumber(labels, housenumber)
+    return islice(labels, config.FRANCE_LABELS_MAX or None)
+
+
+def _signatures(labels, signatures, housenumber):
+    # Label => (length, bigrams, missing bigrams).
+    by_label = {}
+    for label, signature in zip(labels, signatures):
+        if housenumber:
+            variant = _housenumber_signature(signature, housenumber)
+            if variant is not None:
+                by_label["{} {}".format(housenumber, label)] = variant
+        by_label.setdefault(label, (*signature, 0))
+    return by_label
+
+
+def make_labels(helper, result):
+    """
+    Generate search labels for a result.
+
+    Labels are generated in priority order: the housenumber variant of each
+    label comes first. This ordering is important for result scoring in addok.
+
+    With FRANCE_LABELS_LAZY, only the first label is computed for non
+    autocomplete searches, score_by_ngram_distance pulls the others as needed.
+    """
+    if result.labels:
+        return
+    labels = iter_result_labels(result)
+    if config.FRANCE_LABELS_LAZY and not getattr(helper, "autocomplete", True):
+        result.labels.extend(islice(labels, 1))
+        result._labels_stream = labels
+    else:
+        result.labels.extend(labels)
+
+
+def _pull_labels(result):
+    # Yield the labels already computed, then the lazy ones, keeping
+    # result.labels up to date.
+    yield from result.labels[:]
+    for label in getattr(result, "_labels_stream", None) or ():
+        result.labels.append(label)
+        yield label
+
+
+def _query_bigrams(helper):
+    # Length of the query, and the number of its bigrams by bit of the
+    # signatures, computed once per search.
+    try:
+        return helper._france_bigrams
+    except AttributeError:
+        counts = {}
+        query = helper.query
+        for left, right in zip(query, query[1:]):
+            bit = 1 << ((ord(left) * 37 + ord(right)) % SIGNATURE_BITS)
+            counts[bit] = counts.get(bit, 0) + 1
+        helper._france_bigrams = len(query), counts
+        return helper._france_bigrams
+
+
+def _max_score(signature, query_length, counts):
+    """
+    Return an upper bound of compare_ngrams(label, query) from the signature.
+
+    The score is shared / (label bigrams + query bigrams - shared): the
+    bigrams shared can be no more than the query bigrams whose bit is set in
+    the label signature.
+    """
+    length, bits, missing = signature
+    if length < 2 or query_length < 2:
+        return 1.0  # compare_ngrams special cases.
+    shared = missing
+    for bit in counts:
+        if bits & bit:
+            shared += counts[bit]
+    shared = min(shared, length - 1, query_length - 1)
+    return float(shared) / (length + query_length - 2 - shared)
+
+
+def score_by_ngram_distance(helper, result):
+    """
+    Same as addok's score_by_ngram_distance, but labels generated lazily by
+    make_labels are only computed until a good enough one is found.
+
+    Labels with a signature (see FRANCE_LABELS_SIGNATURES) are skipped
+    without being compared when they cannot score better than a previous one.
+    """
+    if helper.autocomplete:
+        return
+    signatures = getattr(result, "_label_signatures", None)
+    best = None
+    for label in _pull_labels(result):
+        if best is not None and signatures:
+            signature = signatures.get(label)
+            if signature is not None and _max_score(
+                signature, *_query_bigrams(helper)
+            ) <= best:
+                continue
+        score = compare_ngrams(ascii(label), helper.query)
+        result.add_score("str_distance", score, ceiling=1.0)
+        if score >= config.MATCH_THRESHOLD:
+            break
+        if best is None or score > best:
+            best = score
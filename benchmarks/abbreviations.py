@@ -0,0 +1,94 @@
+"""
+Index keys and lookups saved by canonicalize.
+
+Counts the distinct tokens and pairs of tokens (one Redis key each) produced
+by PROCESSORS for the names of a sample of documents, and the distinct tokens
+(one lookup each) of the queries, without and with canonicalize. Run from the
+repository root, on a BAN export (NDJSON) or on a generated sample:
+
+    python -m benchmarks.abbreviations adresses-addok-90.ndjson
+    python -m benchmarks.abbreviations
+"""
+import argparse
+import json
+import random
+
+from addok.config import config
+from addok.helpers import iter_pipe
+
+from addok_france import canonicalize
+from addok_france.utils import CANONICAL_FORMS
+
+from .corpus import QUERIES
+from .processors import load_config
+
+WORDS = ["victor hugo", "du general de gaulle", "saint pierre", "des lilas",
+         "du marechal foch", "sainte anne", "du president wilson", "de la gare"]
+
+
+def generate(count, seed=0):
+    """Yield street names, with words abbreviated or not.
+
+    Half the words which have abbreviations are abbreviated, far more than in
+    the BAN: the keys saved on this sample only show that canonicalize works,
+    measure the saving on a BAN export.
+    """
+    rand = random.Random(seed)
+    abbreviations = {}
+    for form, canonical in CANONICAL_FORMS.items():
+        abbreviations.setdefault(canonical, []).append(form)
+    types = [t for t in abbreviations if " " not in t]
+    for _ in range(count):
+        words = [rand.choice(types)] + rand.choice(WORDS).split()
+        yield " ".join(
+            rand.choice(abbreviations[word] + [word])
+            if word in abbreviations and rand.random() < 0.5
+            else word
+            for word in words
+        )
+
+
+def tokens(value, processors):
+    return list(iter_pipe(value, processors))
+
+
+def count(names, queries, processors):
+    keys = set()
+    for name in names:
+        found = tokens(name, processors)
+        keys.update(found)
+        keys.update(zip(found, found[1:]))
+    lookups = [len(set(tokens(query, processors))) for query in queries]
+    return len(keys), sum(lookups) / len(lookups)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("filepath", nargs="?", help="NDJSON sample")
+    parser.add_argument(
+        "--names", type=int, default=20000, help="Names to generate"
+    )
+    args = parser.parse_args(argv)
+    load_config()
+    if args.filepath:
+        names = []
+        with open(args.filepath) as f:
+            for line in f:
+                name = json.loads(line).get("name") or []
+                names.extend([name] if isinstance(name, str) else name)
+    else:
+        names = list(generate(args.names))
+    queries = QUERIES + list(generate(len(QUERIES), seed=1))
+    without = config.PROCESSORS
+    with_ = without + [canonicalize]
+    print("{:<20} {:>12} {:>18}".format("", "index keys", "lookups per query"))
+    results = [count(names, queries, without), count(names, queries, with_)]
+    for label, (keys, lookups) in zip(["without", "canonicalize"], results):
+        print("{:<20} {:>12} {:>18.2f}".format(label, keys, lookups))
+    print("{:<20} {:>+11.1f}%".format(
+        "change", (results[1][0] - results[0][0]) / results[0][0] * 100
+    ))
+
+
+if __name__ == "__main__":
+    main()
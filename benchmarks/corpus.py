@@ -0,0 +1,79 @@
+"""Representative inputs for the benchmarks."""
+
+QUERIES = [
+    # Plain addresses.
+    "8 rue de la paix 75002 paris",
+    "12 bd victor hugo lille",
+    "3 bis avenue des champs elysees paris",
+    "32bis Rue des Vosges93290",
+    "241 r de la republique lyon",
+    "rue des lilas",
+    "place bellecour",
+    "avenue jean jaures 31400 toulouse",
+    "0003 impasse des petrels 76460 saint valery en caux",
+    "15 chemin des oliviers 06000 nice",
+    "7 allée des tilleuls",
+    "1 place de l'hôtel de ville 59000 lille",
+    "route de paris",
+    "lieu dit les chenes",
+    "Saint Didier s/s Ecouves",
+    "air s/ l'adour",
+    # Municipalities and postcodes.
+    "paris",
+    "marseille 13016",
+    "75010",
+    "saint etienne",
+    "chemille en anjou",
+    "montigny le bretonneux",
+    # Business mail with extra info.
+    "2 allée Jules Guesde 31068 TOULOUSE CEDEX 7",
+    "2 allée Jules Guesde BP 7015 31068 TOULOUSE",
+    "20 avenue de Ségur TSA 30719 75334 Paris Cedex 07",
+    "20 rue saint germain CIDEX 304 89110 Poilly-sur-tholon",
+    "6, rue Winston-Churchill CS 40055 60321 Compiègne",
+    "BP 20169 Cite administrative - 8e étage Rue Gustave-Delory 59017 Lille",
+    "Immeuble Plein-Centre 60, avenue du Centre 78180 Montigny-le-Bretonneux",
+    "Tribunal d'instance de Guebwiller 1, place Saint-Léger 68504 Guebwiller",
+    "Maison de la Médiation 72 Chaussée de l'Hôtel de Ville 59650 VILLENEUVE D ASCQ",  # noqa
+    "PARC D ACTIVITE DE SAUMATY 26 AV ANDRE ROUSSIN 13016 MARSEILLE 16",
+    "resid goelands 28 bis impasse des petrels 76460 Saint-valery-en-caux",
+    "Centre social 3 rue du Laurier 73000 CHAMBERY",
+]
+
+DOCUMENTS = [
+    {
+        "_id": "street",
+        "type": "street",
+        "name": "rue des Lilas",
+        "city": "Paris",
+        "postcode": "75010",
+    },
+    {
+        "_id": "municipality",
+        "type": "municipality",
+        "name": "Lille",
+        "city": "Lille",
+        "postcode": "59000",
+    },
+    {
+        "_id": "merged",
+        "type": "street",
+        "name": "RUE PIERRE LEPOUREAU",
+        "postcode": "49120",
+        "city": [
+            "ST GEORGES DES GARDES (CHEMILLE EN ANJOU)",
+            "ST GEORGES DES GARDES",
+            "CHEMILLE EN ANJOU",
+        ],
+    },
+    {
+        "_id": "aliases",
+        "type": "street",
+        "name": ["avenue du Général Leclerc", "avenue Leclerc"],
+        "postcode": "92100",
+        "city": ["Boulogne-Billancourt", "Boulogne"],
+    },
+]
+
+# Housenumber of each document, as set by match_housenumber.
+HOUSENUMBERS = [None, "1", "2 bis", "12"]
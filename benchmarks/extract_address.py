@@ -0,0 +1,83 @@
+"""
+Worst case of extract_address, on adversarial inputs.
+
+Times extract_address, and the regex it replaces, on digit-heavy inputs of
+growing size, and reports the time per input character: it must stay flat as
+inputs grow. Run from the repository root:
+
+    python -m benchmarks.extract_address
+    python -m benchmarks.extract_address --max-ns-per-char 1000
+"""
+import argparse
+import sys
+import time
+
+from addok.config import config
+
+from addok_france.utils import EXTRACT_ADDRESS_PATTERN, extract_address
+
+from .processors import load_config
+
+FAMILIES = {
+    # Every number is a candidate start, none is followed by a street type.
+    "numbers": "1 ",
+    "identifiers": "SIRET 123 456 789 00012 TVA FR 12 345678901 ",
+    "ordinals": "12 bis , 3 ter ",
+    "almost types": "1 ru 2 av3 4 bd, 5 rond ",
+    # Long space runs after a number and an ordinal.
+    "spaces": "1" + " " * 50 + "b" + " " * 50,
+    # The address is at the very end.
+    "letterhead": "Ets Dupont SARL capital 10 000 EUR RCS 123 456 ",
+}
+SIZES = [1000, 10000, 100000]
+
+
+def regex(q):
+    match = EXTRACT_ADDRESS_PATTERN.search(q)
+    return match.group() if match else q
+
+
+def inputs(pattern, size):
+    q = (pattern * (size // len(pattern) + 1))[:size]
+    return q + " 8 rue de la paix 75002 paris" if pattern.startswith("Ets") else q
+
+
+def timeit(func, q, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter_ns()
+        func(q)
+        best = min(best, time.perf_counter_ns() - start)
+    return best / len(q)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--max-ns-per-char",
+        type=float,
+        help="Exit with an error if extract_address is slower than this",
+    )
+    args = parser.parse_args(argv)
+    load_config()
+    config.FRANCE_EXTRACT_MAX_LENGTH = 0  # Measure the scan, not the cap.
+    worst = 0
+    print("{:<16} {:>8} {:>16} {:>16}".format(
+        "", "chars", "regex ns/char", "scan ns/char"
+    ))
+    for name, pattern in FAMILIES.items():
+        for size in SIZES:
+            q = inputs(pattern, size)
+            assert extract_address(q) == regex(q)
+            scan = timeit(extract_address, q)
+            worst = max(worst, scan)
+            print("{:<16} {:>8} {:>16.0f} {:>16.0f}".format(
+                name, len(q), timeit(regex, q), scan
+            ))
+    print("worst: {:.0f} ns/char".format(worst))
+    if args.max_ns_per_char and worst > args.max_ns_per_char:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Size of the stored housenumbers, with and without CompactSerializer.
+
+Run from the repository root, on a BAN department export (NDJSON) or on a
+generated one:
+
+    python -m benchmarks.housenumbers adresses-addok-90.ndjson
+    python -m benchmarks.housenumbers --streets 20000
+"""
+import argparse
+import json
+import random
+
+from addok.helpers.index import prepare_housenumbers
+from addok.helpers.serializers import ZlibSerializer
+
+from addok_france.housenumbers import CompactSerializer
+
+from .processors import load_config
+
+ORDINALS = ["bis", "ter", "quater", "a", "b", "c"]
+
+
+def generate(streets, seed=0):
+    """Yield NDJSON streets shaped like the BAN export."""
+    rand = random.Random(seed)
+    for index in range(streets):
+        lat, lon = 47 + rand.random(), 6 + rand.random()
+        housenumbers = {}
+        for number in range(1, rand.randint(2, 120)):
+            housenumbers[str(number)] = {
+                "id": "90001_{:04}_{:05}".format(index, number),
+                "lat": round(lat + rand.random() / 1000, 6),
+                "lon": round(lon + rand.random() / 1000, 6),
+            }
+            if rand.random() < 0.05:
+                raw = "{} {}".format(number, rand.choice(ORDINALS))
+                housenumbers[raw] = dict(housenumbers[str(number)])
+        yield json.dumps({
+            "id": "90001_{:04}".format(index),
+            "type": "street",
+            "name": "rue {}".format(index),
+            "postcode": "90000",
+            "city": "Belfort",
+            "lat": lat,
+            "lon": lon,
+            "housenumbers": housenumbers,
+        })
+
+
+def load(lines):
+    """Return the prepared documents."""
+    return list(prepare_housenumbers(json.loads(line) for line in lines))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("filepath", nargs="?", help="NDJSON sample")
+    parser.add_argument(
+        "--streets", type=int, default=5000, help="Streets to generate"
+    )
+    args = parser.parse_args(argv)
+    load_config()
+    if args.filepath:
+        with open(args.filepath) as f:
+            lines = f.readlines()
+    else:
+        lines = list(generate(args.streets))
+    docs = load(lines)
+    count = sum(len(doc.get("housenumbers") or {}) for doc in docs)
+    print("{} documents, {} housenumbers".format(len(docs), count))
+    before, after = [
+        sum(len(serializer.dumps(doc)) for doc in docs)
+        for serializer in [ZlibSerializer, CompactSerializer]
+    ]
+    print("{:<32} {:>12} {:>12} {:>8}".format("", "zlib KiB", "compact KiB", "change"))
+    print(
+        "{:<32} {:>12.0f} {:>12.0f} {:>+7.1f}%".format(
+            "stored (serialized documents)",
+            before / 1024,
+            after / 1024,
+            (after - before) / before * 100,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
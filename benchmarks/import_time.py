@@ -0,0 +1,94 @@
+"""
+Import time of addok_france, on top of addok.
+
+Imports addok_france in fresh interpreters, after the addok modules it
+depends on, with bytecode cached as on a deployed server, and reports the
+median time and the modules of the plugin taking the longest. Run from the
+repository root:
+
+    python -m benchmarks.import_time
+    python -m benchmarks.import_time --max-ms 15
+
+It exits with an error above MAX_MS by default (`make test` runs it).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Imported before the measure: their cost is addok's, not the plugin's.
+DEPENDENCIES = [
+    "addok.config",
+    "addok.db",
+    "addok.helpers",
+    "addok.helpers.index",
+    "addok.helpers.search",
+    "addok.helpers.serializers",
+    "addok.helpers.text",
+]
+# Median import time budget, in ms: about ten times the measured one, to
+# catch an expensive import at module level, not machine noise.
+MAX_MS = 50
+SCRIPT = """
+import time
+import {}
+start = time.perf_counter()
+import addok_france
+print((time.perf_counter() - start) * 1000)
+""".format(", ".join(DEPENDENCIES))
+
+
+def run(env, *options):
+    return subprocess.run(
+        [sys.executable, *options, "-c", SCRIPT],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def slowest(stderr, count=5):
+    """Return the (self µs, module) of the slowest addok_france modules."""
+    modules = []
+    for line in stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip().startswith("addok_france"):
+            modules.append((int(parts[0].split(":")[1]), parts[2].strip()))
+    return sorted(modules, reverse=True)[:count]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--runs", type=int, default=20, help="Number of interpreters to start"
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=MAX_MS,
+        help="Exit with an error if the median import time exceeds this "
+        "(default: %(default)s, 0 to disable)",
+    )
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        env.pop("PYTHONDONTWRITEBYTECODE", None)
+        run(env)  # Write the bytecode cache.
+        times = [float(run(env).stdout) for _ in range(args.runs)]
+        modules = slowest(run(env, "-X", "importtime").stderr)
+    median = statistics.median(times)
+    print("import addok_france: {:.1f} ms (median), {:.1f} ms (min)".format(
+        median, min(times)
+    ))
+    for self_time, name in modules:
+        print("  {:<32} {:>8.1f} ms".format(name, self_time / 1000))
+    if args.max_ms and median > args.max_ms:
+        sys.exit("Import time above {} ms".format(args.max_ms))
+
+
+if __name__ == "__main__":
+    main()
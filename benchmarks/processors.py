@@ -0,0 +1,195 @@
+"""
+Micro-benchmarks of the France processors.
+
+Run from the repository root:
+
+    python -m benchmarks.processors
+    python -m benchmarks.processors --save baseline.json
+    python -m benchmarks.processors --compare baseline.json
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+from addok.config import config
+from addok.core import Result
+from addok.helpers import iter_pipe
+from addok.helpers.text import normalize, tokenize
+
+from addok_france import utils
+
+from .corpus import DOCUMENTS, HOUSENUMBERS, QUERIES
+
+CONFTEST = Path(__file__).parent.parent / "tests" / "conftest.py"
+
+
+def load_config():
+    """Configure addok with the processors used by the test suite."""
+    spec = importlib.util.spec_from_file_location("conftest", CONFTEST)
+    conftest = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(conftest)
+    conftest.pytest_configure()
+    with contextlib.redirect_stdout(io.StringIO()):
+        config.load()
+
+
+def tokens(query):
+    return list(normalize(tokenize([query])))
+
+
+def labels(item):
+    doc, housenumber = item
+    result = Result(dict(doc))
+    result.housenumber = housenumber
+    utils.make_labels(None, result)
+    return result.labels
+
+
+def chain(query):
+    return list(iter_pipe(query, config.QUERY_PROCESSORS + config.PROCESSORS))
+
+
+def cases():
+    """Return the benchmarks, as name => (function, inputs)."""
+    queries = [utils.extract_address(query) for query in QUERIES]
+    cleaned = [utils.clean_query(query) for query in queries]
+    token_lists = [tokens(query) for query in cleaned]
+    glued = [list(utils.glue_ordinal(items)) for items in token_lists]
+    single_tokens = [token for items in glued for token in items]
+    documents = list(zip(DOCUMENTS, HOUSENUMBERS))
+    prepared = [
+        (utils.prepare_labels(dict(doc)), housenumber)
+        for doc, housenumber in documents
+    ]
+    return {
+        "extract_address": (utils.extract_address, QUERIES),
+        "clean_query": (utils.clean_query, queries),
+        "remove_leading_zeros": (utils.remove_leading_zeros, cleaned),
+        "normalize_query": (utils.normalize_query, QUERIES),
+        "glue_ordinal": (lambda items: list(utils.glue_ordinal(items)), token_lists),
+        "fold_ordinal": (utils.fold_ordinal, single_tokens),
+        "flag_housenumber": (
+            lambda items: list(utils.flag_housenumber(items)),
+            glued,
+        ),
+        "housenumber_pipeline": (
+            lambda items: list(utils.housenumber_pipeline(items)),
+            token_lists,
+        ),
+        "prepare_labels": (lambda doc: utils.prepare_labels(dict(doc)), DOCUMENTS),
+        "make_labels": (labels, documents),
+        "make_labels (prepared)": (labels, prepared),
+        "chain": (chain, QUERIES),
+    }
+
+
+def measure(func, inputs, duration):
+    # Throughput, without timer calls around each call.
+    calls = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for item in inputs:
+            func(item)
+        calls += len(inputs)
+    ops = calls / (time.perf_counter() - start)
+    # Latency of each call.
+    latencies = []
+    for _ in range(max(1, calls // len(inputs) // 10)):
+        for item in inputs:
+            before = time.perf_counter_ns()
+            func(item)
+            latencies.append((time.perf_counter_ns() - before) / 1000)
+    percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    # Peak of memory allocated while processing the whole corpus once.
+    tracemalloc.start()
+    for item in inputs:
+        func(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ops": ops,
+        "p50": percentiles[49],
+        "p95": percentiles[94],
+        "p99": percentiles[98],
+        "peak": peak,
+    }
+
+
+def compare(results, baseline, max_regression=None):
+    """Print ops/sec changes, return the names regressing above the limit."""
+    regressions = []
+    print("\n{:<24} {:>12} {:>12} {:>8}".format("", "baseline", "ops/sec", "change"))
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]["ops"]
+        change = (result["ops"] - before) / before * 100
+        print(
+            "{:<24} {:>12.0f} {:>12.0f} {:>+7.1f}%".format(
+                name, before, result["ops"], change
+            )
+        )
+        if max_regression is not None and change < -max_regression:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("names", nargs="*", help="Only run these benchmarks")
+    parser.add_argument(
+        "--duration", type=float, default=1.0, help="Seconds per benchmark"
+    )
+    parser.add_argument("--save", help="Save results to this JSON file")
+    parser.add_argument("--compare", help="Compare with results saved in this file")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        help="Exit with an error if ops/sec drop more than this percentage",
+    )
+    args = parser.parse_args(argv)
+    load_config()
+    results = {}
+    print(
+        "{:<24} {:>12} {:>9} {:>9} {:>9} {:>10}".format(
+            "", "ops/sec", "p50 µs", "p95 µs", "p99 µs", "peak KiB"
+        )
+    )
+    for name, (func, inputs) in cases().items():
+        if args.names and name not in args.names:
+            continue
+        result = results[name] = measure(func, inputs, args.duration)
+        print(
+            "{:<24} {:>12.0f} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.1f}".format(
+                name,
+                result["ops"],
+                result["p50"],
+                result["p95"],
+                result["p99"],
+                result["peak"] / 1024,
+            )
+        )
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {"python": platform.python_version(), "results": results},
+                f,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,8 @@
+import argparse
+
+import pytest
+
+
 def pytest_configure():
     from addok.config import config
     config.QUERY_PROCESSORS_PYPATHS = [
@@ -5,6 +10,13 @@ def pytest_configure():
         "addok_france.clean_query",
         "addok_france.remove_leading_zeros",
     ]
+    config.BATCH_PROCESSORS_PYPATHS = [
+        "addok.batch.to_json",
+        "addok.helpers.index.prepare_housenumbers",
+        "addok_france.prepare_labels",
+        "addok.ds.store_documents",
+        "addok.helpers.index.index_documents",
+    ]
     config.SEARCH_RESULT_PROCESSORS_PYPATHS = [
         'addok.helpers.results.match_housenumber',
         'addok_france.make_labels',
@@ -21,3 +33,17 @@ def pytest_configure():
         "addok_france.flag_housenumber",
         "addok.helpers.text.synonymize",
     ]
+
+
+@pytest.fixture
+def run_command():
+    """Run an addok command registered by the plugin, from its arguments."""
+    from addok_france import register_command
+
+    def run(*args):
+        parser = argparse.ArgumentParser()
+        register_command(parser.add_subparsers())
+        args = parser.parse_args(args)
+        args.func(args)
+
+    return run
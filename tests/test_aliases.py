@@ -0,0 +1,157 @@
+import json
+
+import pytest
+
+from addok.batch import process_documents
+from addok.core import Result, search
+from addok.db import DB
+from addok.ds import get_document
+from addok.helpers import keys
+from addok.helpers.index import deindex_document
+
+from addok_france import make_labels, prepare_labels
+from addok_france.aliases import (CHECKSUM_KEY, AliasTable, CityAliasesIndexer,
+                                  expand, write_table)
+
+ROWS = [
+    ("Chemillé-en-Anjou", "49092"),
+    ("Saint-Georges-des-Gardes", "49092"),
+    ("Chanzeaux", "49092"),
+    ("Cherbourg-en-Cotentin", "50129"),
+    ("Cherbourg-Octeville", "50129"),
+    ("Ajaccio", "2A004"),
+    ("Lyon", "69123"),
+]
+
+
+@pytest.fixture
+def aliases(config, tmp_path, monkeypatch):
+    path = tmp_path / "aliases.bin"
+    write_table(ROWS, path)
+    config.FRANCE_CITY_ALIASES_PATH = str(path)
+    config.INDEXERS = [CityAliasesIndexer] + config.INDEXERS
+    monkeypatch.setattr("addok_france.aliases._CHECKED", set())
+    return path
+
+
+def lilas(**kwargs):
+    return json.dumps(dict({
+        "_id": "xxxx", "type": "street", "name": "rue des Lilas",
+        "city": "Cherbourg-en-Cotentin", "citycode": "50129",
+        "postcode": "50100", "lat": "49.63", "lon": "-1.62",
+    }, **kwargs))
+
+
+def test_alias_table(aliases):
+    table = AliasTable.from_file(aliases)
+    assert len(table) == 2  # Only the citycodes with aliases.
+    assert table.get("49092") == [
+        "Chemillé-en-Anjou", "Saint-Georges-des-Gardes", "Chanzeaux"
+    ]
+    assert table.get("50129") == ["Cherbourg-en-Cotentin", "Cherbourg-Octeville"]
+    assert table.get("69123") is None
+    assert table.get("49093") is None
+    assert table.get("") is None
+    assert table.get(None) is None
+
+
+def test_empty_alias_table(tmp_path):
+    path = tmp_path / "aliases.bin"
+    assert write_table([("Lyon", "69123")], path) == 0
+    assert AliasTable.from_file(path).get("69123") is None
+
+
+def test_invalid_alias_table(tmp_path):
+    path = tmp_path / "aliases.bin"
+    path.write_text("nom;code_insee\n")
+    with pytest.raises(ValueError):
+        AliasTable.from_file(path)
+
+
+def test_expand(aliases):
+    assert expand(["Cherbourg-en-Cotentin"], "50129") == [
+        "Cherbourg-en-Cotentin", "Cherbourg-Octeville"
+    ]
+    assert expand(["Cherbourg-Octeville", "Cherbourg-en-Cotentin"], "50129") == [
+        "Cherbourg-Octeville", "Cherbourg-en-Cotentin"
+    ]
+    assert expand(["Lyon"], "69123") == ["Lyon"]
+    assert expand(["Lyon"], None) == ["Lyon"]
+
+
+def test_expand_without_table(config):
+    config.FRANCE_CITY_ALIASES_PATH = None
+    assert expand(["Cherbourg-en-Cotentin"], "50129") == ["Cherbourg-en-Cotentin"]
+
+
+def test_make_labels_from_alias_table(aliases):
+    process_documents(lilas())
+    result = Result(get_document("d|xxxx"))
+    make_labels(None, result)
+    assert result.labels[:2] == [
+        "rue des Lilas 50100 Cherbourg-en-Cotentin",
+        "rue des Lilas 50100",
+    ]
+    assert "rue des Lilas 50100 Cherbourg-Octeville" in result.labels
+    # The city property is left as is.
+    assert result.city == "Cherbourg-en-Cotentin"
+
+
+def test_search_with_alias_table(aliases):
+    process_documents(json.dumps({
+        "_id": "xxxx", "type": "street", "name": "rue des Lilas",
+        "city": ["Cherbourg-Octeville", "Cherbourg-en-Cotentin"],
+        "citycode": "50129", "postcode": "50100", "lat": "49.63", "lon": "-1.62",
+    }))
+    result = search("rue des lilas cherbourg octeville")[0]
+    assert result._rawattr("city") == [
+        "Cherbourg-Octeville", "Cherbourg-en-Cotentin"
+    ]
+    assert result.labels[0] == "rue des Lilas 50100 Cherbourg-Octeville"
+
+
+def test_documents_store_their_own_city_only(aliases):
+    process_documents(lilas())
+    stored = get_document("d|xxxx")
+    assert stored["city"] == "Cherbourg-en-Cotentin"
+    assert "_labels" not in stored  # Computed by make_labels.
+    result = search("rue des lilas cherbourg octeville")[0]
+    assert result.city == "Cherbourg-en-Cotentin"
+    assert "rue des Lilas 50100 Cherbourg-Octeville" in result.labels
+    assert DB.get(CHECKSUM_KEY).decode() == AliasTable.from_file(aliases).checksum
+
+
+def test_aliases_are_deindexed(aliases):
+    process_documents(lilas())
+    assert DB.exists(keys.token_key("octeville"))
+    process_documents(lilas(city="Valognes", citycode="50615", _action="update"))
+    assert not DB.exists(keys.token_key("octeville"))
+    assert search("rue des lilas valognes")[0].city == "Valognes"
+
+
+def test_prepare_labels_without_aliases(aliases):
+    doc = prepare_labels([json.loads(lilas(city="Lyon", citycode="69123"))])
+    assert next(doc)["_labels"][0] == "rue des Lilas 50100 Lyon"
+
+
+def test_other_table_is_refused(aliases, tmp_path, config, capsys):
+    process_documents(lilas())
+    other = tmp_path / "other.bin"
+    write_table(ROWS[:2], other)
+    config.FRANCE_CITY_ALIASES_PATH = str(other)
+    with pytest.raises(ValueError):
+        deindex_document(get_document("d|xxxx"))
+    process_documents(lilas(_id="yyyy"))
+    assert "another city aliases table" in capsys.readouterr().out
+    assert len(search("rue des lilas")) == 1
+
+
+def test_command(tmp_path, capsys, run_command):
+    cities = tmp_path / "cities.csv"
+    cities.write_text(
+        "nom;code_insee\n" + "".join("{};{}\n".format(*row) for row in ROWS)
+    )
+    output = tmp_path / "aliases.bin"
+    run_command("france-aliases", str(cities), "--output", str(output))
+    assert capsys.readouterr().out == "2 citycodes with aliases.\n"
+    assert AliasTable.from_file(output).get("2a004") is None
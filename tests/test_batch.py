@@ -0,0 +1,68 @@
+from itertools import count
+
+import pytest
+
+from addok_france.batch import imap_chunks, normalize, normalize_rows
+
+
+def double(chunk):
+    return [i * 2 for i in chunk]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_imap_chunks_keeps_input_order(workers):
+    chunks = imap_chunks(double, range(100), chunksize=7, workers=workers)
+    assert [i for chunk in chunks for i in chunk] == list(range(0, 200, 2))
+
+
+def test_imap_chunks_is_lazy():
+    # Would never return if the whole input was read first.
+    chunks = imap_chunks(double, count(), chunksize=10, workers=2)
+    assert next(chunks) == list(range(0, 20, 2))
+    chunks.close()
+
+
+def test_normalize():
+    assert normalize("2 allée Jules Guesde BP 7015 31068 TOULOUSE") == (
+        "2 allée Jules Guesde 31068 TOULOUSE"
+    )
+
+
+def test_normalize_rows():
+    rows = [{"id": str(i), "q": "Lieu-dit Les Chênes {}".format(i)}
+            for i in range(50)]
+    result = list(normalize_rows(rows, "q", "clean", chunksize=4, workers=2))
+    assert [row["id"] for row in result] == [str(i) for i in range(50)]
+    assert result[3] == {"id": "3", "q": "Lieu-dit Les Chênes 3",
+                         "clean": "Les Chênes 3"}
+
+
+def test_workers_get_the_config(config):
+    # Spawned workers do not inherit the config of this process.
+    config.FRANCE_EXTRACT_MAX_LENGTH = 10
+    rows = [{"q": "Ets Dupont 12 rue des Lilas 75010 Paris"} for i in range(4)]
+    expected = list(normalize_rows([dict(row) for row in rows], "q", "q",
+                                   workers=1))
+    assert expected[0]["q"] == "Ets Dupont 12 rue des Lilas 75010 Paris"
+    result = normalize_rows(rows, "q", "q", chunksize=2, workers=2,
+                            method="spawn")
+    assert list(result) == expected
+
+
+def test_command(tmp_path, run_command):
+    source = tmp_path / "input.csv"
+    source.write_text(
+        "id;address\n"
+        "1;Bâtiment B 12 rue des Lilas 75010 Paris\n"
+        "2;BP 12 Le Bourg 42000 SAINT-ETIENNE\n"
+    )
+    output = tmp_path / "output.csv"
+    run_command(
+        "france-normalize", str(source), "--column", "address",
+        "--delimiter", ";", "--output", str(output), "--workers", "1",
+    )
+    assert output.read_text().splitlines() == [
+        "id;address",
+        "1;12 rue des Lilas 75010 Paris",
+        "2;Le Bourg 42000 SAINT-ETIENNE",
+    ]
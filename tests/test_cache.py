@@ -0,0 +1,37 @@
+import pytest
+
+from addok_france import cache, clean_query
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_cache_is_disabled_by_default():
+    query = "2 allée Jules Guesde BP 7015 31068 TOULOUSE"
+    assert list(clean_query([query])) == ["2 allée Jules Guesde 31068 TOULOUSE"]
+    assert cache.stats()["clean_query"] == {
+        "hits": 0, "misses": 0, "evictions": 0, "size": 0}
+
+
+def test_cache_counts_hits_and_misses(config):
+    config.FRANCE_QUERY_CACHE_SIZE = 10
+    query = "2 allée Jules Guesde BP 7015 31068 TOULOUSE"
+    for _ in range(3):
+        assert list(clean_query([query])) == [
+            "2 allée Jules Guesde 31068 TOULOUSE"]
+    assert cache.stats()["clean_query"] == {
+        "hits": 2, "misses": 1, "evictions": 0, "size": 1}
+
+
+def test_cache_evicts_least_recently_used(config):
+    config.FRANCE_QUERY_CACHE_SIZE = 2
+    list(clean_query(["rue a", "rue b", "rue a", "rue c"]))
+    stats = cache.stats()["clean_query"]
+    assert stats["evictions"] == 1
+    assert stats["size"] == 2
+    # "rue b" was the least recently used, "rue a" is still cached.
+    assert list(cache.CACHES["clean_query"].data) == ["rue a", "rue c"]
@@ -0,0 +1,45 @@
+import pytest
+
+from addok_france.cedex import CedexTable
+from addok_france.utils import clean_query, normalize_query
+
+
+@pytest.fixture
+def cedex_path(config, tmp_path):
+    path = tmp_path / "cedex.csv"
+    path.write_text(
+        "code_cedex;code_postal\n31068;31000\n75334;75007\n01012;01000\n"
+    )
+    config.FRANCE_CEDEX_PATH = str(path)
+    return path
+
+
+def test_cedex_table(cedex_path):
+    table = CedexTable.from_file(cedex_path)
+    assert len(table) == 3
+    assert table.get("31068") == "31000"
+    assert table.get("01012") == "01000"
+    assert table.get("31069") is None
+    assert table.get("99999") is None
+    assert table.get("3106a") is None
+
+
+@pytest.mark.parametrize("input,expected", [
+    ["2 allée Jules Guesde 31068 TOULOUSE CEDEX 7",
+     "2 allée Jules Guesde 31000 TOULOUSE"],
+    ["20 avenue de Ségur TSA 30719 75334 Paris Cedex 07",
+     "20 avenue de Ségur 75007 Paris"],
+    # Unknown CEDEX code: fallback to the department.
+    ["2 allée Jules Guesde 31099 TOULOUSE CEDEX 7",
+     "2 allée Jules Guesde 31 TOULOUSE"],
+])
+def test_clean_query_resolves_cedex(cedex_path, input, expected):
+    assert clean_query(input) == expected
+    assert normalize_query(input) == expected
+
+
+def test_clean_query_without_cedex_table(config):
+    config.FRANCE_CEDEX_PATH = None
+    assert clean_query("2 allée Jules Guesde 31068 TOULOUSE CEDEX 7") == (
+        "2 allée Jules Guesde 31 TOULOUSE"
+    )
@@ -0,0 +1,113 @@
+import pytest
+
+from addok.core import Search
+from addok.helpers.search import (search_tokens, select_tokens,
+                                  set_should_match_threshold, tokenize)
+
+from addok_france import city_filter, postcode_filter
+from addok_france.cities import CityTrie
+
+
+@pytest.fixture
+def cities(config, tmp_path):
+    path = tmp_path / "cities.csv"
+    path.write_text(
+        "nom;code_insee\n"
+        "Saint-Étienne;42218\n"
+        "Lyon;69123\n"
+        "Saint-Denis;93066\n"
+        "Saint-Denis;97411\n"
+        # Former name of a commune nouvelle.
+        "Cherbourg-Octeville;50129\n"
+        "Cherbourg-en-Cotentin;50129\n"
+    )
+    config.FRANCE_CITIES_PATH = str(path)
+    config.FILTERS = ["type", "postcode", "citycode"]
+    config.SEARCH_PREPROCESSORS = [
+        tokenize,
+        postcode_filter,
+        city_filter,
+        search_tokens,
+        select_tokens,
+        set_should_match_threshold,
+    ]
+
+
+@pytest.fixture
+def paix(cities, factory):
+    factory(name="rue de la Paix", city="Saint-Étienne", citycode="42218",
+            postcode="42000")
+    factory(name="rue de la Paix", city="Lyon", citycode="69123",
+            postcode="69002")
+    factory(name="rue de la Paix", city="Saint-Denis", citycode="93066",
+            postcode="93200")
+    factory(name="rue de la Paix", city="Saint-Denis", citycode="97411",
+            postcode="97400")
+    factory(name="avenue de Lyon", city="Cherbourg-en-Cotentin",
+            citycode="50129", postcode="50100")
+
+
+@pytest.mark.parametrize("words,expected", [
+    [["rue", "de", "la", "paix", "saint", "etienne"], (4, ["42218"])],
+    [["rue", "de", "la", "paix", "etienne"], (4, ["99999"])],
+    [["cherbourg", "octeville"], (0, ["50129"])],
+    [["saint", "denis"], (0, ["93066", "97411"])],
+    [["saint", "denis", "rue"], None],
+    [[], None],
+])
+def test_city_trie(cities, words, expected):
+    trie = CityTrie([
+        ("Saint-Étienne", "42218"),
+        ("Étienne", "99999"),
+        ("Cherbourg-Octeville", "50129"),
+        ("Saint-Denis", "93066"),
+        ("Saint-Denis", "97411"),
+    ])
+    assert trie.match(words) == expected
+
+
+@pytest.mark.parametrize("query,citycode", [
+    ["12 rue de la paix saint-etienne", "42218"],
+    ["12 rue de la paix saint etienne 42000", "42218"],
+    ["rue de la paix lyon", "69123"],
+    ["avenue de lyon cherbourg octeville", "50129"],
+    # Homonyms, told apart by the postcode.
+    ["rue de la paix 97400 saint denis", "97411"],
+    ["rue de la paix saint denis", None],
+    # Not a city.
+    ["avenue de lyon", None],
+    ["lyon", None],
+    ["rue de la paix", None],
+])
+def test_city_filter(paix, query, citycode):
+    helper = Search()
+    helper(query)
+    filters = [f for f in helper.filters if f.startswith("f|citycode|")]
+    assert filters == (["f|citycode|" + citycode] if citycode else [])
+
+
+def test_city_filter_narrows_results(paix):
+    helper = Search()
+    results = helper("rue de la paix saint etienne")
+    assert [r.citycode for r in results] == ["42218"]
+    assert "etienne" not in helper.tokens
+
+
+def test_city_filter_unknown_citycode(paix):
+    helper = Search()
+    helper("rue de la paix cherbourg")
+    assert helper.filters == []
+
+
+def test_city_filter_keeps_caller_filter(paix):
+    helper = Search()
+    results = helper("rue de la paix lyon", citycode="93066")
+    assert helper.filters == ["f|citycode|93066"]
+    assert [r.citycode for r in results] == ["93066"]
+
+
+def test_city_filter_needs_config(config, paix):
+    config.FILTERS = ["type", "postcode"]
+    helper = Search()
+    helper("rue de la paix saint etienne")
+    assert helper.filters == []
@@ -0,0 +1,101 @@
+import falcon
+import pytest
+from falcon import testing
+
+from addok.core import Search
+
+from addok_france import department_hint, register_http_endpoint, routing_hint
+from addok_france.departments import department_of
+
+
+@pytest.fixture
+def cities(config, tmp_path):
+    path = tmp_path / "cities.csv"
+    path.write_text(
+        "nom,code_insee\n"
+        "Toulouse,31555\n"
+        "Paris,75056\n"
+        "Saint-Martin,973xx\n"
+        "Saint-Martin,05157\n"
+        "Saint-Martin,32398\n"
+        "Ajaccio,2A004\n"
+        "Saint-Denis,93066\n"
+        "Saint-Denis,97411\n"
+        "Lyon,69123\n"
+    )
+    config.FRANCE_CITIES_PATH = str(path)
+
+
+@pytest.mark.parametrize("code,expected", [
+    ["75010", "75"],
+    ["01000", "01"],
+    ["20000", "2A"],
+    ["20200", "2B"],
+    ["2A004", "2A"],
+    ["2b033", "2B"],
+    ["97411", "974"],
+    ["98000", "980"],
+])
+def test_department_of(code, expected):
+    assert department_of(code) == expected
+
+
+@pytest.mark.parametrize("query,departments,confidence", [
+    ["8 rue de la paix 75002 paris", ["75"], 1.0],
+    ["2 allée Jules Guesde 31068 TOULOUSE CEDEX 7", ["31"], 1.0],
+    # BP numbers are not postcodes.
+    ["BP 20169 Rue Gustave-Delory 59017 Lille", ["59"], 1.0],
+    ["rue des lilas", [], 0.0],
+    ["place du capitole toulouse", ["31"], 0.8],
+    # Output of clean_query for a CEDEX address.
+    ["2 allée Jules Guesde 31 TOULOUSE", ["31"], 1.0],
+    # Last city wins over the one in the street name.
+    ["rue de paris lyon", ["69", "75"], 0.582],
+    ["ajaccio", ["2A"], 0.8],
+    # Ambiguous city.
+    ["rue du stade saint denis", ["93", "974"], 0.2],
+    ["rue du stade 97400 saint denis", ["974"], 1.0],
+])
+def test_routing_hint(cities, query, departments, confidence):
+    hint = routing_hint(query)
+    assert hint["departments"] == departments
+    assert hint["confidence"] == confidence
+    assert hint["broadcast"] is (confidence < 0.5)
+
+
+def test_routing_hint_without_cities(config):
+    assert routing_hint("place du capitole toulouse") == {
+        "departments": [],
+        "confidence": 0.0,
+        "broadcast": True,
+    }
+
+
+def test_department_hint_annotates_search(config, cities):
+    config.SEARCH_PREPROCESSORS = config.SEARCH_PREPROCESSORS + [department_hint]
+    helper = Search()
+    helper("rue du capitole 31000 toulouse")
+    assert helper.department_hint["departments"] == ["31"]
+
+
+def test_http_endpoint(config, cities):
+    app = falcon.App()
+    register_http_endpoint(app)
+    client = testing.TestClient(app)
+    resp = client.simulate_get("/france/route", params={"q": "toulouse"})
+    assert resp.json == {
+        "query": "toulouse",
+        "departments": ["31"],
+        "confidence": 0.8,
+        "broadcast": False,
+    }
+    assert client.simulate_get("/france/route").status_code == 400
+    resp = client.simulate_get("/france/route", params={
+        "q": "x" * (config.QUERY_MAX_LENGTH + 1)})
+    assert resp.status_code == 413
+
+
+def test_routing_hint_is_linear():
+    # A lookahead per code would take seconds.
+    query = "31000 " * 50000 + "toulouse cedex"
+    assert routing_hint(query)["departments"] == ["31"]
@@ -0,0 +1,88 @@
+import io
+import json
+
+from addok.batch import process_documents, to_json
+from addok.core import search
+from addok.ds import store_documents
+from addok.helpers.index import index_documents
+
+import addok_france
+from addok_france import utils
+from addok_france.documents import (is_prepared, prepare_document,
+                                    prepare_file, prepare_housenumbers)
+
+
+def make_doc():
+    return {
+        "_id": "xxxx",
+        "type": "street",
+        "name": "rue des Lilas",
+        "city": "Paris",
+        "postcode": "75010",
+        "lat": "48.32545",
+        "lon": "2.2565",
+        "housenumbers": {
+            "1 bis": {"lat": "48.325451", "lon": "2.25651"},
+            "3": {"lat": "48.325452", "lon": "2.25652"},
+        },
+    }
+
+
+def test_prepare_document(config):
+    doc = prepare_document(make_doc())
+    assert doc["housenumbers"] == {
+        "1b": {"lat": "48.325451", "lon": "2.25651", "raw": "1 bis"},
+        "3": {"lat": "48.325452", "lon": "2.25652", "raw": "3"},
+    }
+    assert doc["_labels"][0] == "rue des Lilas 75010 Paris"
+
+
+def test_prepare_housenumbers_skips_prepared_documents(config):
+    doc = prepare_document(make_doc())
+    assert prepare_housenumbers(json.loads(json.dumps(doc))) == doc
+
+
+def test_is_prepared_housenumbers_field(config):
+    doc = prepare_document(make_doc())
+    assert is_prepared(doc)
+    config.HOUSENUMBERS_FIELD = "numbers"
+    assert not is_prepared(doc)
+    assert is_prepared({"numbers": doc["housenumbers"]})
+
+
+def test_prepare_labels_skips_prepared_documents(config):
+    doc = prepare_document(make_doc())
+    doc["_labels"] = ["rue des Lilas"]
+    assert utils.prepare_labels(doc)["_labels"] == ["rue des Lilas"]
+
+
+def test_prepare_file_workers_get_the_config(config):
+    # Spawned workers do not inherit the config of this process.
+    lines = [json.dumps(make_doc())] * 4
+    output = io.StringIO()
+    assert prepare_file(lines, output, chunksize=2, workers=2,
+                        method="spawn") == 4
+    doc = json.loads(output.getvalue().splitlines()[0])
+    assert doc == prepare_document(make_doc())
+
+
+def test_command_output_can_be_indexed(config, tmp_path, run_command):
+    source = tmp_path / "ban.ndjson"
+    source.write_text(json.dumps(make_doc()) + "\n\nnot json\n")
+    output = tmp_path / "prepared.ndjson"
+    run_command(
+        "france-preprocess", str(source), "--output", str(output),
+        "--workers", "1",
+    )
+    lines = output.read_text().splitlines()
+    assert len(lines) == 1
+    config.BATCH_PROCESSORS = [
+        to_json,
+        addok_france.prepare_housenumbers,
+        store_documents,
+        index_documents,
+    ]
+    process_documents(*lines)
+    result = search("1 bis rue des lilas")[0]
+    assert result.housenumber == "1 bis"
+    assert str(result) == "1 bis rue des Lilas 75010 Paris"
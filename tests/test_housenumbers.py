@@ -0,0 +1,182 @@
+import json
+import zlib
+
+import pytest
+
+from addok.batch import process_documents, to_json
+from addok.core import search
+from addok.ds import store_documents
+from addok.helpers.serializers import ZlibSerializer
+
+from addok.helpers.index import index_documents, prepare_housenumbers
+from addok.helpers.results import match_housenumber as addok_match_housenumber
+
+from addok_france import match_housenumber
+from addok_france.housenumbers import (CompactSerializer, build_index, closest,
+                                       pack, unpack)
+
+
+@pytest.mark.parametrize("housenumbers", [
+    {"1": {"lat": "48.1", "lon": "2.1", "raw": "1"}},
+    {
+        "1b": {"lat": "48.1", "lon": "2.1", "raw": "1 bis"},
+        "2": {"lat": "48.2", "lon": "2.2", "raw": "2"},
+        "3": {"lat": "48.3", "lon": "2.3", "raw": "3", "postcode": "75011"},
+    },
+])
+def test_pack_unpack(housenumbers):
+    assert unpack(pack(housenumbers)) == housenumbers
+
+
+def test_pack_does_not_store_raw_equal_to_token():
+    assert pack({
+        "1b": {"lat": "48.1", "raw": "1 bis"},
+        "2": {"lat": "48.2", "raw": "2"},
+    }) == [["1b", "2"], {"lat": ["48.1", "48.2"], "raw": ["1 bis", None]}, [1, 2]]
+    assert pack({"2": {"lat": "48.2", "raw": "2"}}) == [["2"], {"lat": ["48.2"]}, [2]]
+
+
+def test_pack_sorts_housenumbers():
+    packed = pack({
+        "x": {"raw": "x"}, "10": {"raw": "10"}, "3b": {"raw": "3 bis"},
+        "3": {"raw": "3"},
+    })
+    assert packed == [
+        ["3", "3b", "10", "x"], {"raw": [None, "3 bis", None, None]}, [3, 3, 10],
+    ]
+    housenumbers = unpack(packed)
+    assert list(housenumbers) == ["3", "3b", "10", "x"]
+    assert housenumbers.index == [[3, 3, 10], ["3", "3b", "10", "x"]]
+    assert closest(housenumbers.index, "11", 1) == "10"
+    # Packed by a previous version.
+    assert unpack([["3"], {}]).index is None
+
+
+@pytest.mark.parametrize("doc", [
+    {"name": "Paris"},
+    {"name": "rue", "housenumbers": {"1b": {"lat": "48.1", "raw": "1 bis"}}},
+    # Not prepared, or with null values: stored as is.
+    {"name": "rue", "housenumbers": {"1 bis": {"lat": "48.1"}}},
+    {"name": "rue", "housenumbers": {"1": {"lat": "48.1", "raw": "1", "x": None}}},
+])
+def test_compact_serializer(doc):
+    blob = CompactSerializer.dumps(doc)
+    assert CompactSerializer.loads(blob) == doc
+    # Documents stored by the default serializer are still readable.
+    assert CompactSerializer.loads(ZlibSerializer.dumps(doc)) == doc
+
+
+def test_compact_serializer_housenumbers_field(config):
+    config.HOUSENUMBERS_FIELD = "numbers"
+    doc = {"name": "rue", "numbers": {"1b": {"lat": "48.1", "raw": "1 bis"}}}
+    blob = CompactSerializer.dumps(doc)
+    assert json.loads(zlib.decompress(blob))["numbers"][0] == ["1b"]
+    assert CompactSerializer.loads(blob) == doc
+
+
+def test_index_and_search_with_compact_serializer(config):
+    config.DOCUMENT_SERIALIZER = CompactSerializer
+    process_documents(
+        '{"_id": "xxxx", "type": "street", "name": "rue des Lilas", '
+        '"city": "Paris", "postcode": "75010", "lat": "48.32", "lon": "2.25", '
+        '"housenumbers": {"1 bis": {"lat": "48.325451", "lon": "2.25651"}, '
+        '"3": {"lat": "48.325452", "lon": "2.25652"}}}'
+    )
+    result = search("1 bis rue des lilas")[0]
+    assert result.housenumber == "1 bis"
+    assert result.lat == "48.325451"
+    result = search("3 rue des lilas")[0]
+    assert result.housenumber == "3"
+
+
+def test_build_index():
+    tokens = ["12", "3t", "x", "3", "10", "3b", "3z"]
+    assert build_index(tokens) == [
+        [3, 3, 3, 3, 10, 12],
+        ["3", "3b", "3t", "3z", "10", "12"],
+    ]
+
+
+@pytest.mark.parametrize("token,max_distance,expected", [
+    ["3", 0, "3"],
+    ["3b", 0, "3"],
+    ["5t", 0, "5b"],
+    ["4", 0, None],
+    ["4", 1, "3"],  # Tie: the lower one.
+    ["6", 1, "5b"],
+    ["7", 1, None],
+    ["8", 2, "9"],
+    ["1", 2, "3"],
+    ["20", 20, "9"],
+    ["x", 20, None],
+])
+def test_closest(token, max_distance, expected):
+    index = build_index(["3", "3b", "5b", "5t", "9"])
+    assert closest(index, token, max_distance) == expected
+
+
+@pytest.fixture(params=[ZlibSerializer, CompactSerializer])
+def lilas(config, request):
+    # With CompactSerializer, the housenumbers are stored sorted.
+    config.DOCUMENT_SERIALIZER = request.param
+    config.BATCH_PROCESSORS = [
+        to_json,
+        prepare_housenumbers,
+        store_documents,
+        index_documents,
+    ]
+    config.SEARCH_RESULT_PROCESSORS = [
+        match_housenumber if r is addok_match_housenumber else r
+        for r in config.SEARCH_RESULT_PROCESSORS
+    ]
+    process_documents(json.dumps({
+        "_id": "xxxx", "type": "street", "name": "rue des Lilas",
+        "city": "Paris", "postcode": "75010", "lat": "48.32", "lon": "2.25",
+        "housenumbers": {
+            "1 bis": {"lat": "48.1", "lon": "2.1"},
+            "3": {"lat": "48.3", "lon": "2.3"},
+            "9": {"lat": "48.9", "lon": "2.9"},
+        },
+    }))
+
+
+@pytest.mark.parametrize("query,housenumber", [
+    ["3 rue des lilas", "3"],
+    ["1 bis rue des lilas", "1 bis"],
+    ["3 ter rue des lilas", None],
+    ["1 rue des lilas", None],
+    ["5 rue des lilas", None],
+])
+def test_match_housenumber(lilas, query, housenumber):
+    result = search(query)[0]
+    assert result.housenumber == housenumber
+    assert result.type == ("housenumber" if housenumber else "street")
+
+
+@pytest.mark.parametrize("query,housenumber", [
+    ["3 rue des lilas", "3"],
+    ["3 ter rue des lilas", "3"],
+    ["1 rue des lilas", "1 bis"],
+    ["5 rue des lilas", None],
+])
+def test_match_same_number(config, lilas, query, housenumber):
+    config.FRANCE_HOUSENUMBER_MAX_DISTANCE = 0
+    result = search(query)[0]
+    assert result.housenumber == housenumber
+    assert result.type == ("housenumber" if housenumber else "street")
+
+
+@pytest.mark.parametrize("query,housenumber", [
+    ["5 rue des lilas", "3"],
+    ["6 rue des lilas", "3"],
+    ["7 rue des lilas", "9"],
+])
+def test_match_nearest_housenumber(config, lilas, query, housenumber):
+    config.FRANCE_HOUSENUMBER_MAX_DISTANCE = 3
+    assert search(query)[0].housenumber == housenumber
+
+
+def test_match_housenumber_type_filter(config, lilas):
+    config.FRANCE_HOUSENUMBER_MAX_DISTANCE = 0
+    assert search("5 rue des lilas", type="housenumber") == []
+    assert search("3 ter rue des lilas", type="housenumber")[0].housenumber == "3"
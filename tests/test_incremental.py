@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from addok.batch import process_documents, to_json
+from addok.core import search
+from addok.db import DB
+from addok.ds import get_document, store_documents
+from addok.helpers import keys
+from addok.helpers.index import index_documents
+
+import addok_france
+from addok_france.incremental import (HASHES_KEY, SEEN_KEY, document_hash,
+                                      fingerprint, prune)
+
+
+@pytest.fixture
+def processors(config):
+    config.BATCH_PROCESSORS = [
+        to_json,
+        addok_france.prepare_housenumbers,
+        addok_france.skip_unchanged,
+        store_documents,
+        index_documents,
+        addok_france.store_hashes,
+    ]
+
+
+def doc(_id, name, **kwargs):
+    return json.dumps(dict({
+        "_id": _id, "type": "street", "name": name, "city": "Paris",
+        "postcode": "75010", "lat": "48.32", "lon": "2.25",
+    }, **kwargs))
+
+
+def test_document_hash_is_stable():
+    first = {"name": "rue des Lilas", "_id": "1", "lat": "48.1"}
+    second = {"lat": "48.1", "_id": "1", "name": "rue des Lilas"}
+    assert document_hash(first) == document_hash(second)
+    assert document_hash(first) == document_hash(dict(first, _action="update"))
+    assert document_hash(first) != document_hash(dict(first, lat="48.2"))
+
+
+def test_unchanged_documents_are_skipped(processors):
+    assert len(process_documents(doc("1", "rue des Lilas"), doc("2", "rue"))) == 2
+    assert DB.hlen(HASHES_KEY) == 2
+    processed = process_documents(doc("1", "rue des Lilas"), doc("2", "rue"))
+    assert processed == []
+
+
+def test_changed_documents_are_reindexed(processors):
+    process_documents(doc("1", "rue des Lilas", housenumbers={"1 bis": {
+        "lat": "48.1", "lon": "2.1"}}))
+    processed = process_documents(doc("1", "rue des Roses"))
+    assert [d["name"] for d in processed] == ["rue des Roses"]
+    # No stale token left from the previous version.
+    assert not DB.exists(keys.token_key("lilas"))
+    assert search("1 bis rue des roses")[0].name == "rue des Roses"
+    assert get_document("d|1")["name"] == "rue des Roses"
+    expected = document_hash(processed[0], fingerprint())
+    assert DB.hget(HASHES_KEY, "1").decode() == expected
+
+
+def test_processors_change_reindexes(config, processors):
+    process_documents(doc("1", "rue des Lilas"))
+    config.PROCESSORS = config.PROCESSORS[:-1]  # Without synonymize.
+    assert len(process_documents(doc("1", "rue des Lilas"))) == 1
+    assert process_documents(doc("1", "rue des Lilas")) == []
+
+
+def test_force_reindex(config, processors):
+    process_documents(doc("1", "rue des Lilas"))
+    config.FRANCE_REINDEX_FORCE = True
+    assert len(process_documents(doc("1", "rue des Lilas"))) == 1
+    assert search("rue des lilas")[0].name == "rue des Lilas"
+
+
+def test_actions_update_the_hash(processors):
+    process_documents(doc("1", "rue des Lilas"))
+    process_documents(doc("1", "rue des Roses", _action="update"))
+    assert search("rue des roses")[0].name == "rue des Roses"
+    # The updated version is the known one now.
+    assert process_documents(doc("1", "rue des Roses")) == []
+    assert len(process_documents(doc("1", "rue des Lilas"))) == 1
+
+
+def test_deleted_documents(processors):
+    process_documents(doc("1", "rue des Lilas"))
+    process_documents(json.dumps({"_id": "1", "_action": "delete"}))
+    assert not DB.exists(keys.token_key("lilas"))
+    assert not DB.hexists(HASHES_KEY, "1")
+
+
+def test_prune(processors):
+    process_documents(doc("1", "rue des Lilas"), doc("2", "rue des Roses"))
+    assert prune() == 0  # Nothing is stale after the first import.
+    assert not DB.exists(SEEN_KEY)
+    # Next import, without "2".
+    process_documents(doc("1", "rue des Lilas"))
+    assert prune(dry_run=True) == 1
+    assert search("rue des roses")[0].name == "rue des Roses"
+    assert prune() == 1
+    assert not DB.exists(keys.token_key("roses"))
+    assert get_document("d|2") is None
+    assert search("rue des lilas")[0].name == "rue des Lilas"
+    assert DB.hkeys(HASHES_KEY) == [b"1"]
+
+
+def test_prune_without_import(processors):
+    process_documents(doc("1", "rue des Lilas"))
+    prune()
+    # Nothing imported since: do not remove everything.
+    assert prune() == 0
+    assert search("rue des lilas")[0].name == "rue des Lilas"
+
+
+def test_command(processors, capsys, run_command):
+    process_documents(doc("1", "rue des Lilas"))
+    prune()
+    process_documents(doc("2", "rue des Roses"))
+    run_command("france-prune", "--dry-run")
+    assert capsys.readouterr().out == "1 documents to remove.\n"
+    run_command("france-prune")
+    assert capsys.readouterr().out == "1 documents removed.\n"
@@ -0,0 +1,97 @@
+import itertools
+import json
+
+import pytest
+
+from addok.batch import process_documents
+from addok.core import search
+from addok.helpers.search import preprocess_query
+from addok.helpers.text import Token
+
+import addok_france
+from addok_france import cache, metrics, utils
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics(monkeypatch):
+    # Restore utils.RULE_HITS after instrument.
+    monkeypatch.setattr(utils, "RULE_HITS", None)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_processors_are_not_wrapped_by_default(config):
+    import addok_france
+    assert addok_france.clean_query in config.QUERY_PROCESSORS
+    preprocess_query("2 allée Jules Guesde BP 7015 31068 TOULOUSE")
+    assert metrics.snapshot()["processors"].get("clean_query") is None
+
+
+def test_instrument_counts_calls_and_rules(config):
+    metrics.instrument(config)
+    preprocess_query("2 allée Jules Guesde BP 7015 31068 TOULOUSE CEDEX 7")
+    preprocess_query("Lieu-Dit Les Chênes")
+    snapshot = metrics.snapshot()
+    assert snapshot["processors"]["clean_query"]["calls"] == 2
+    assert snapshot["processors"]["clean_query"]["time"] > 0
+    assert snapshot["processors"]["glue_ordinal"]["calls"] == 2
+    assert snapshot["rules"]["bp"] == 1
+    assert snapshot["rules"]["cedex_postcode"] == 1
+    assert snapshot["rules"]["lieu_dit"] == 1
+    assert snapshot["rules"]["sous"] == 0
+
+
+def test_instrument_result_processors(config):
+    metrics.instrument(config)
+    process_documents(json.dumps({
+        '_id': 'yyyy',
+        'type': 'street',
+        'name': 'rue des Lilas',
+        'city': 'Paris',
+        'postcode': '75010',
+        'lat': '49.32545',
+        'lon': '4.2565',
+    }))
+    assert metrics.snapshot()["processors"]["prepare_labels"]["calls"] == 1
+    results = search("rue des lilas paris")
+    assert str(results[0]) == "rue des Lilas 75010 Paris"
+    assert metrics.snapshot()["processors"]["make_labels"]["calls"] == 1
+
+
+def test_instrument_keeps_the_query_cache(config):
+    config.FRANCE_QUERY_CACHE_SIZE = 10
+    clean_query_cache = cache.CACHES["clean_query"]
+    clean_query_cache.clear()
+    metrics.instrument(config)
+    for _ in range(2):
+        preprocess_query("BP 7015 31068 TOULOUSE")
+    assert cache.CACHES["clean_query"] is clean_query_cache
+    assert clean_query_cache.stats()["hits"] == 1
+    # Counted when the rules run only.
+    assert metrics.snapshot()["rules"]["bp"] == 1
+    assert metrics.snapshot()["processors"]["clean_query"]["calls"] == 2
+    clean_query_cache.clear()
+
+
+@pytest.mark.parametrize("query,postcode,spaces", [
+    # Single pass.
+    ["12 rue  des Lilas 7501075010", 2, 1],
+    # Fallback to clean_query: what was counted before is not counted twice.
+    ["12 rue  des Lilas BP 12 75010", 1, 1],
+])
+def test_instrument_normalize_query(config, query, postcode, spaces):
+    config.QUERY_PROCESSORS = [addok_france.normalize_query]
+    metrics.instrument(config)
+    preprocess_query(query)
+    rules = metrics.snapshot()["rules"]
+    assert (rules["postcode"], rules["spaces"]) == (postcode, spaces)
+
+
+def test_timed_pipe_is_lazy():
+    pipe = metrics.timed_pipe(addok_france.fold_ordinal, "fold_ordinal")(
+        itertools.repeat(Token("1bis"))
+    )
+    assert next(pipe) == "1b"
+    pipe.close()
+    assert metrics.snapshot()["processors"]["fold_ordinal"]["calls"] == 1
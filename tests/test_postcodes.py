@@ -0,0 +1,101 @@
+import pytest
+
+from addok.core import Search, search
+from addok.db import DB
+from addok.helpers.search import (search_tokens, select_tokens,
+                                  set_should_match_threshold, tokenize)
+
+from addok_france import postcode_filter
+from addok_france.postcodes import (HousenumberPostcodesIndexer, is_postcode,
+                                    on_load)
+
+
+@pytest.mark.parametrize("value,expected", [
+    ["75010", True],
+    ["01000", True],
+    ["20000", True],
+    ["97400", True],
+    ["98000", True],
+    ["00100", False],
+    ["96000", False],
+    ["99000", False],
+    ["7501", False],
+    ["750100", False],
+    ["75O10", False],
+])
+def test_is_postcode(value, expected):
+    assert is_postcode(value) is expected
+
+
+@pytest.fixture
+def preprocessors(config):
+    config.SEARCH_PREPROCESSORS = [
+        tokenize,
+        postcode_filter,
+        search_tokens,
+        select_tokens,
+        set_should_match_threshold,
+    ]
+
+
+@pytest.fixture
+def lilas(factory):
+    factory(name="rue des Lilas", city="Paris", postcode="75010")
+    factory(name="rue des Lilas", city="Lyon", postcode="69003")
+
+
+def test_postcode_becomes_a_filter(preprocessors, lilas):
+    helper = Search()
+    results = helper("rue des lilas 69003")
+    assert [r.city for r in results] == ["Lyon"]
+    assert helper.filters == ["f|postcode|69003"]
+    assert "69003" not in helper.tokens
+
+
+def test_unknown_postcode_is_left_in_query(preprocessors, lilas):
+    helper = Search()
+    results = helper("rue des lilas 75011")
+    assert len(results) == 2
+    assert helper.filters == []
+    assert "75011" in helper.tokens
+
+
+def test_postcode_alone_is_not_a_filter(preprocessors, lilas):
+    helper = Search()
+    results = helper("69003")
+    assert [r.city for r in results] == ["Lyon"]
+    assert helper.filters == []
+
+
+def test_postcode_filter_given_by_caller(preprocessors, lilas):
+    results = search("rue des lilas 69003", postcode="75010")
+    assert [r.city for r in results] == ["Paris"]
+
+
+@pytest.fixture
+def indexer(config, preprocessors):
+    # Through the fixture, so that it is restored after the test.
+    config.INDEXERS = list(config.INDEXERS)
+    on_load()
+    assert HousenumberPostcodesIndexer in config.INDEXERS
+
+
+def test_housenumber_with_its_own_postcode(indexer, factory):
+    factory(name="rue des Lilas", city="Paris", postcode="75010",
+            housenumbers={"12": {"lat": "48.1", "lon": "2.1",
+                                 "postcode": "75011"}})
+    factory(name="rue des Lilas", city="Lyon", postcode="69003")
+    results = search("12 rue des lilas 75011")
+    assert [(r.housenumber, r.postcode) for r in results] == [("12", "75011")]
+    assert [r.city for r in search("rue des lilas 75010")] == ["Paris"]
+
+
+def test_housenumber_postcodes_are_deindexed(indexer, factory):
+    from addok.ds import get_document
+    from addok.helpers.index import deindex_document
+
+    doc = factory(name="rue des Lilas", city="Paris", postcode="75010",
+                  housenumbers={"12": {"lat": "48.1", "lon": "2.1",
+                                       "postcode": "75011"}})
+    deindex_document(get_document("d|" + doc["_id"]))
+    assert not DB.exists("f|postcode|75011")
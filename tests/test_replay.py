@@ -0,0 +1,81 @@
+import io
+
+import pytest
+
+from addok.helpers import iter_pipe
+from addok.helpers.text import ascii
+
+from addok_france.replay import Histogram, read_queries, replay
+
+
+def test_read_queries_from_lines():
+    f = io.StringIO("rue des Lilas\r\n\n2 bis rue de Paris\n")
+    assert list(read_queries(f)) == ["rue des Lilas", "", "2 bis rue de Paris"]
+
+
+def test_read_queries_from_csv_column():
+    f = io.StringIO("date;q\n2024-01-01;rue des Lilas\n2024-01-02;\n")
+    assert list(read_queries(f, "q", ";")) == ["rue des Lilas", ""]
+
+
+def test_histogram():
+    histogram = Histogram()
+    values = [i / 10 for i in range(1, 10001)]
+    for value in values:
+        histogram.add(value)
+    assert len(histogram) == 10000
+    assert histogram.total == pytest.approx(sum(values))
+    for q, exact in [(0.5, 500), (0.95, 950), (0.99, 990)]:
+        assert histogram.quantile(q) == pytest.approx(exact, rel=0.01)
+    histogram.add(0)
+    histogram.add(10 ** 12)
+    assert histogram.quantile(0) == pytest.approx(Histogram.MIN, rel=0.01)
+    assert len(histogram.counts) == Histogram.SIZE
+
+
+def test_replay_times_each_stage(config):
+    output = io.StringIO()
+    count, elapsed, stages = replay(
+        ["2 allée Jules Guesde BP 7015 31068 TOULOUSE", "6 bis rue de Paris"],
+        output=output,
+    )
+    assert count == 2
+    assert elapsed > 0
+    assert list(stages) == [
+        "addok_france.utils.extract_address",
+        "addok_france.utils.clean_query",
+        "addok_france.utils.remove_leading_zeros",
+        "addok.helpers.text.tokenize",
+        "addok.helpers.text._normalize",
+        "addok_france.utils.glue_ordinal",
+        "addok_france.utils.fold_ordinal",
+        "addok_france.utils.flag_housenumber",
+        "addok.helpers.text.synonymize",
+    ]
+    assert all(len(latencies) == 2 for latencies in stages.values())
+    assert output.getvalue() == (
+        "2 allee jules guesde 31068 toulouse\n6b rue de paris\n"
+    )
+
+
+def test_replay_queries_as_search_does(config):
+    query = "12 rue de Paris Bray s/ Seine"
+    processors = config.QUERY_PROCESSORS + config.PROCESSORS
+    output = io.StringIO()
+    replay([query], output=output)
+    # The "s/" rule of clean_query cannot match once the query is asciified.
+    assert list(iter_pipe(query, processors)) != list(
+        iter_pipe(ascii(query), processors))
+    assert output.getvalue() == " ".join(iter_pipe(ascii(query), processors)) + "\n"
+
+
+def test_command(config, tmp_path, capsys, run_command):
+    log = tmp_path / "queries.csv"
+    log.write_text("q,lat\nrue des Lilas,48.1\n6 bis rue de Paris,\n")
+    output = tmp_path / "normalized.txt"
+    run_command("france-replay", str(log), "--column", "q", "--output",
+                str(output))
+    out = capsys.readouterr().out
+    assert out.startswith("2 queries in")
+    assert "addok_france.utils.glue_ordinal" in out
+    assert output.read_text() == "rue des lilas\n6b rue de paris\n"
@@ -0,0 +1,135 @@
+import io
+
+import pytest
+
+from addok.helpers import iter_pipe
+
+from addok_france import (clean_query, extract_address, flag_housenumber,
+                          normalize_query, remove_leading_zeros)
+from addok_france.shadow import Shadow, compare, on_load, report
+
+QUERIES = [
+    "2 allée Jules Guesde BP 7015 31068 TOULOUSE CEDEX 7",
+    "Ets Dupont 008 rue de Paris  75002 Paris",
+    "lieu dit  les 3 chênes",
+]
+CHAIN = [extract_address, clean_query, remove_leading_zeros]
+
+
+def test_identical_chains():
+    shadow = compare(QUERIES, CHAIN, [normalize_query])
+    assert shadow.count == 3
+    assert shadow.diverged == 0
+    assert shadow.reference_time > 0
+    assert shadow.candidate_time > 0
+
+
+def test_divergences():
+    found = []
+    shadow = Shadow(CHAIN, CHAIN[:2], on_divergence=found.append)
+    for query in QUERIES:
+        shadow.run(query)
+    assert shadow.diverged == 1
+    assert list(shadow.divergences) == found == [
+        (QUERIES[1], ["8 rue de Paris 75002 Paris"], ["008 rue de Paris 75002 Paris"])
+    ]
+
+
+def test_keep_last_divergences():
+    shadow = Shadow([extract_address], [clean_query], keep=1)
+    for query in QUERIES:
+        shadow.run(query)
+    assert shadow.diverged == 3
+    assert [d.query for d in shadow.divergences] == [QUERIES[2]]
+
+
+def test_candidate_error():
+    def broken(pipe):
+        raise ValueError("oops")
+
+    shadow = Shadow(CHAIN, [broken])
+    assert shadow.run(QUERIES[1]) == ["8 rue de Paris 75002 Paris"]
+    assert shadow.divergences[0].candidate == "ValueError: oops"
+
+
+def test_token_divergences(config):
+    # Same strings, only the housenumber flag differs.
+    processors = [p for p in config.PROCESSORS if p is not flag_housenumber]
+    shadow = compare(["12 rue des lilas"], CHAIN + config.PROCESSORS,
+                     CHAIN + processors)
+    assert shadow.diverged == 1
+    reference, candidate = shadow.divergences[0][1:]
+    assert [t[0] for t in reference] == [t[0] for t in candidate]
+    assert reference[0][:3] == ("12", "housenumber", "12")
+    assert candidate[0][1] is None
+
+
+def test_shadow_as_processor():
+    shadow = Shadow(CHAIN, [normalize_query])
+    assert list(iter_pipe(QUERIES[1], [shadow])) == ["8 rue de Paris 75002 Paris"]
+    assert shadow.count == 1
+
+
+def test_report():
+    out = io.StringIO()
+    report(compare(QUERIES, CHAIN, CHAIN[:2]), out=out)
+    lines = out.getvalue().splitlines()
+    assert lines[:3] == [
+        QUERIES[1],
+        "  - ['8 rue de Paris 75002 Paris']",
+        "  + ['008 rue de Paris 75002 Paris']",
+    ]
+    assert lines[4] == (
+        "candidate: addok_france.utils.extract_address, "
+        "addok_france.utils.clean_query"
+    )
+    assert lines[5].startswith("3 queries, 1 divergences; reference ")
+
+
+def test_on_load(config, caplog):
+    # Through the fixture, so that it is restored after the test.
+    config.QUERY_PROCESSORS = CHAIN
+    config.FRANCE_SHADOW_QUERY_PROCESSORS = CHAIN[:2]
+    on_load()
+    assert len(config.QUERY_PROCESSORS) == 1
+    shadow = config.QUERY_PROCESSORS[0]
+    assert list(iter_pipe(QUERIES[1], config.QUERY_PROCESSORS)) == [
+        "8 rue de Paris 75002 Paris"
+    ]
+    assert shadow.diverged == 1
+    assert "Shadow divergence" in caplog.text
+
+
+def test_command(tmp_path, capsys, run_command):
+    log = tmp_path / "queries.txt"
+    log.write_text("\n".join(QUERIES) + "\n")
+    run_command("france-shadow", str(log), "--candidate",
+                "addok_france.normalize_query", "--tokens")
+    out = capsys.readouterr().out
+    assert out.startswith("reference: addok_france.utils.extract_address")
+    assert "3 queries, 0 divergences" in out
+
+
+def test_command_fails_on_divergence(tmp_path, capsys, run_command):
+    log = tmp_path / "queries.csv"
+    log.write_text("q\n" + QUERIES[1] + "\n")
+    with pytest.raises(SystemExit):
+        run_command("france-shadow", str(log), "--column", "q", "--candidate",
+                    "addok_france.extract_address, addok_france.clean_query")
+    assert capsys.readouterr().out.startswith(QUERIES[1])
+
+
+def test_command_queries_as_search_does(tmp_path, capsys, run_command,
+                                        monkeypatch):
+    log = tmp_path / "queries.txt"
+    log.write_text("  12 rue de Paris Bray s/ Seine\n")
+    queries = []
+
+    def run(self, query):
+        queries.append(query)
+        return []
+
+    monkeypatch.setattr(Shadow, "run", run)
+    run_command("france-shadow", str(log), "--candidate",
+                "addok_france.normalize_query")
+    assert queries == ["12 rue de paris bray s seine"]
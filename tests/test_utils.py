@@ -1,16 +1,30 @@
 import json
+import re
 
 import pytest
 
 from addok.batch import process_documents
 from addok.core import search, Result
 from addok.ds import get_document
+from addok.helpers import iter_pipe
 from addok.helpers.text import Token
-from addok_france.utils import (clean_query, extract_address, flag_housenumber,
-                                fold_ordinal, glue_ordinal, make_labels,
+from addok_france.utils import (EXTRACT_ADDRESS_PATTERN, LazyPattern,
+                                canonicalize, clean_query, clean_query_batch,
+                                extract_address, extract_address_batch,
+                                flag_housenumber, fold_ordinal, glue_ordinal,
+                                is_street_type, make_labels, normalize_query,
                                 remove_leading_zeros)
 
 
+def test_lazy_pattern():
+    pattern = LazyPattern(r"(\d+)", flags=re.IGNORECASE)
+    assert "sub" not in vars(pattern)
+    assert pattern.sub(r"<\1>", "rue 12") == "rue <12>"
+    assert "sub" in vars(pattern)  # Looked up once.
+    assert pattern.pattern == r"(\d+)"
+    assert pattern.flags & re.IGNORECASE
+
+
 @pytest.mark.parametrize("input,expected", [
     ("2 allée Jules Guesde 31068 TOULOUSE CEDEX 7",
      "2 allée Jules Guesde 31 TOULOUSE"),
@@ -71,6 +85,23 @@ def test_clean_query(input, expected):
     assert clean_query(input) == expected
 
 
+def test_clean_query_batch():
+    queries = [
+        "2 allée Jules Guesde 31068 TOULOUSE CEDEX 7",
+        "bp 18",
+        "BP 20169 Rue Gustave-Delory 59017 Lille",
+        "lieu-dit les Fourneaux",
+        "lieu-dit",
+        "",
+        "2 allée Jules Guesde 31068 TOULOUSE CEDEX 7",
+        "Cedex 5\nbp 18",
+        "5 rue   des  Lilas s/ Marne",
+        "3ème étage 75010 Paris",
+    ]
+    assert clean_query_batch(queries) == [clean_query(q) for q in queries]
+    assert clean_query_batch([]) == []
+
+
 @pytest.mark.parametrize("input,expected", [
     ('Immeuble Plein-Centre 60, avenue du Centre 78180 Montigny-le-Bretonneux',
      '60, avenue du Centre 78180 Montigny-le-Bretonneux'),
@@ -120,6 +151,47 @@ def test_extract_address(input, expected):
     assert extract_address(input) == expected
 
 
+@pytest.mark.parametrize("input", [
+    "12345 6 rue des Lilas",
+    "1 2 3 4 5 rue des Lilas",
+    "12 bis, 14 ter , rue des Lilas",
+    "3    bis    avenue",
+    "3 bis     rue ",
+    "le 8 rond point de l'étoile",
+    "8, rond  point de l'étoile",
+    "SIRET 123 456 789 00012\n8 rue de la Paix\n75002 Paris",
+    "A1 rue des Lilas 2 RUE des Lilas",
+    "1 \u017fquare des Lilas",
+    "1 " * 500 + "rue",
+])
+def test_extract_address_matches_pattern(input):
+    match = EXTRACT_ADDRESS_PATTERN.search(input)
+    assert extract_address(input) == (match.group() if match else input)
+
+
+def test_extract_address_max_length(config):
+    letterhead = "SIRET 123 456 789 00012 TVA FR 12 345678901 " * 10
+    config.FRANCE_EXTRACT_MAX_LENGTH = 100
+    assert extract_address(letterhead + "8 rue de la Paix") == (
+        letterhead + "8 rue de la Paix")
+    assert extract_address("8 rue de la Paix " + letterhead) == (
+        "8 rue de la Paix " + letterhead)
+    config.FRANCE_EXTRACT_MAX_LENGTH = 0
+    assert extract_address(letterhead + "8 rue de la Paix") == (
+        "8 rue de la Paix")
+
+
+def test_extract_address_batch(config):
+    config.FRANCE_EXTRACT_MAX_LENGTH = 10
+    queries = [
+        "Ets Dupont, 8 rue de la Paix",
+        "8 rue de la Paix\n75002 Paris",
+        "Non matching pattern",
+        "8 rue de la Paix\n75002 Paris",
+    ]
+    assert extract_address_batch(queries) == [extract_address(q) for q in queries]
+
+
 @pytest.mark.parametrize("inputs,expected", [
     (['6', 'bis'], ['6bis']),
     (['6'], ['6']),
@@ -196,6 +268,38 @@ def test_flag_housenumber(inputs, expected):
         assert (tokens[0].kind == 'housenumber') == expected
 
 
+@pytest.mark.parametrize("inputs", [
+    ['6', 'bis'],
+    ['60', 'BIS', 'avenue'],
+    ['600', 'quater', 'avenue'],
+    ['6', 's', 'avenue'],
+    ['600', 'b', 'avenue'],
+    ['241', 'r', 'de'],
+    ['241', 'r', 'rue'],
+    ['6', '7', 'bis', 'rue'],
+    ['93031', 'bis'],
+    ['3bis', 'rue', '8', 'mai'],
+    ['4terre'],
+    ['rue', 'du', 'bis'],
+    ['rue', '8', 'mai'],
+    ['9', 'grand', 'rue'],
+    [],
+])
+def test_housenumber_pipeline(inputs):
+    from addok_france.utils import housenumber_pipeline
+
+    def tokens():
+        return [Token(value, position=position)
+                for position, value in enumerate(inputs)]
+
+    expected = list(flag_housenumber(
+        fold_ordinal(token) for token in glue_ordinal(tokens())))
+    tokens = list(housenumber_pipeline(tokens()))
+    assert tokens == expected
+    assert [(t.raw, t.kind, t.position) for t in tokens] == [
+        (t.raw, t.kind, t.position) for t in expected]
+
+
 @pytest.mark.parametrize("street_type,should_match", [
     # Boulevard abbreviations
     ('bld', True),
@@ -261,6 +365,9 @@ def test_flag_housenumber(inputs, expected):
     # Villa
     ('vlla', True),
     ('villa', True),
+    # Case folded by the pattern, not by str.lower.
+    ('İlot', True),
+    ('ſq', True),
     # Negative cases - should NOT match
     ('xyz', False),
     ('abc', False),
@@ -272,8 +379,24 @@ def test_street_type_patterns(street_type, should_match):
     result = bool(TYPES_PATTERN.match(street_type))
     assert result == should_match, \
         f"Pattern should {'match' if should_match else 'not match'} '{street_type}'"
+    assert is_street_type(street_type) == should_match
 
 
+def test_is_street_type_accepts_what_types_pattern_accepts():
+    from addok_france.utils import STREET_TYPES, TYPES_PATTERN
+    alphabet = set("".join(STREET_TYPES)) | set("-_ 0AİſK")
+    for form in STREET_TYPES:
+        candidates = {form, form.upper(), form.title(), form + "-x", "x" + form}
+        candidates.add(form.replace("i", "İ").replace("s", "ſ"))
+        for i in range(len(form) + 1):
+            candidates.add(form[:i] + form[i + 1:])
+            for char in alphabet:
+                candidates.add(form[:i] + char + form[i:])
+                candidates.add(form[:i] + char + form[i + 1:])
+        for candidate in candidates:
+            assert is_street_type(candidate) == bool(
+                TYPES_PATTERN.match(candidate)), candidate
+
 
 @pytest.mark.parametrize("input,expected", [
     ('60bis', '60b'),
@@ -288,6 +411,52 @@ def test_fold_ordinal(input, expected):
     assert fold_ordinal(Token(input)) == expected
 
 
+@pytest.mark.parametrize("input,expected", [
+    ("bd victor hugo", "boulevard victor hugo"),
+    ("av du gal de gaulle", "avenue du general de gaulle"),
+    ("pl st pierre", "place saint pierre"),
+    ("r des lilas", "r des lilas"),  # Single letters are kept.
+    ("allees des lilas", "allees des lilas"),  # Plurals too.
+    ("car lot", "car lot"),  # And words.
+    ("crs mirabeau", "cours mirabeau"),
+    ("gr rue", "gr rue"),  # Ambiguous: grande or grès?
+    ("rue anc", "rue anc"),  # Ancien or ancienne?
+    ("pte rue du moulin", "pte rue du moulin"),  # Porte or petite?
+    ("rpt des lilas", "rpt des lilas"),
+    ("route de ham", "route de ham"),  # Commune of Ham.
+])
+def test_canonicalize(input, expected):
+    tokens = [Token(t, position=i) for i, t in enumerate(input.split())]
+    canonical = list(canonicalize(tokens))
+    assert " ".join(canonical) == expected
+    assert [t.position for t in canonical] == [t.position for t in tokens]
+    assert [t.raw for t in canonical] == input.split()
+
+
+def test_canonicalize_after_synonyms(config):
+    config.SYNONYMS = {"st": "saint", "ste": "sainte", "mal": "malin"}
+    config.PROCESSORS = config.PROCESSORS + [canonicalize]
+    assert [str(t) for t in iter_pipe("Mal St Pierre", config.PROCESSORS)] == [
+        "malin", "saint", "pierre"
+    ]
+
+
+def test_canonicalize_at_index_and_search_time(config):
+    config.PROCESSORS = config.PROCESSORS + [canonicalize]
+    process_documents(json.dumps({
+        "_id": "yyyy",
+        "type": "street",
+        "name": "Bd du Maréchal Foch",
+        "city": "Ste Colombe",
+        "lat": "49.32545",
+        "lon": "4.2565",
+    }))
+    for query in ["boulevard du marechal foch sainte colombe",
+                  "bd du mal foch ste colombe"]:
+        results = search(query)
+        assert [str(r) for r in results] == ["Bd du Maréchal Foch Ste Colombe"]
+
+
 @pytest.mark.parametrize("input,expected", [
     ('03', '3'),
     ('00009', '9'),
@@ -298,6 +467,33 @@ def test_remove_leading_zeros(input, expected):
     assert remove_leading_zeros(input) == expected
 
 
+@pytest.mark.parametrize("input", [
+    "2 allée Jules Guesde 31068 TOULOUSE CEDEX 7",
+    "2 allée Jules Guesde B.P. N 7015 31068 TOULOUSE",
+    "BP 20169 Cite administrative - 8e étage Rue Gustave-Delory 59017 Lille",
+    "Saint Didier s/s Ecouves",
+    "Lieu-Dit Les Chênes",
+    "Lieu-Dit",
+    "32bis Rue des Vosges93290",
+    "Immeuble Plein-Centre 60, avenue du Centre 78180 Montigny-le-Bretonneux",
+    "resid goelands 28  bis impasse des petrels 76460 Saint-valery-en-caux",
+    "PARC D ACTIVITE DE SAUMATY 26 AV ANDRE ROUSSIN 13016 MARSEILLE 16",
+    "0003 rue des Lilas 02230 Fresnoy-le-Grand",
+    "rue des Lilas 0012345678",
+    "rue des Lilas 1234500012",
+    "rue des Lilas 000007",
+    "rue_0012 rue 0012_",
+    "  rue   des   Lilas  ",
+    "\t75010\tParis",
+    "00",
+    "0",
+    "",
+])
+def test_normalize_query(input):
+    expected = remove_leading_zeros(clean_query(extract_address(input)))
+    assert normalize_query(input) == expected
+
+
 def test_index_housenumbers_use_processors(config):
     doc = {
         'id': 'xxxx',
@@ -428,6 +624,60 @@ def test_make_labels(config):
     ]
 
 
+def test_make_labels_are_prepared_at_index_time(config):
+    doc = {
+        'id': 'xxxx',
+        '_id': 'yyyy',
+        'type': 'street',
+        'name': 'rue des Lilas',
+        'city': 'Paris',
+        'postcode': '75010',
+        'lat': '49.32545',
+        'lon': '4.2565',
+    }
+    process_documents(json.dumps(doc))
+    stored = get_document('d|yyyy')
+    expected = [
+        'rue des Lilas 75010 Paris',
+        'rue des Lilas 75010',
+        'rue des Lilas Paris',
+        'rue des Lilas',
+    ]
+    assert stored['_labels'] == expected
+    result = Result(stored)
+    make_labels(None, result)
+    assert result.labels == expected
+    # Do not expose them in the result properties.
+    assert '_labels' not in result._doc
+    # Documents indexed without them still get their labels.
+    result = Result(doc)
+    make_labels(None, result)
+    assert result.labels == expected
+
+
+def test_prepare_labels_skips_housenumbers_overriding_fields(config):
+    doc = {
+        'id': 'xxxx',
+        '_id': 'yyyy',
+        'type': 'street',
+        'name': 'rue des Lilas',
+        'city': 'Paris',
+        'postcode': '75010',
+        'lat': '49.32545',
+        'lon': '4.2565',
+        'housenumbers': {
+            '1': {'lat': '48.325451', 'lon': '2.25651', 'postcode': '75011'}
+        }
+    }
+    process_documents(json.dumps(doc))
+    result = Result(get_document('d|yyyy'))
+    assert '_labels' not in result._doc
+    result.update({'postcode': '75011'})  # Simulate match_housenumber
+    result.housenumber = '1'
+    make_labels(None, result)
+    assert result.labels[0] == '1 rue des Lilas 75011 Paris'
+
+
 def test_make_labels_merged_cities(config):
     """Test labels generation for addresses in merged municipalities."""
     doc = {
@@ -470,6 +720,88 @@ def test_make_labels_merged_cities(config):
     assert any('CHEMILLE EN ANJOU' in label and 'ST GEORGES DES GARDES' not in label for label in result.labels)
 
 
+def test_make_labels_are_unique(config):
+    doc = {
+        "_id": "yyyy",
+        "type": "street",
+        "postcode": "49120",
+        "name": ["RUE PIERRE LEPOUREAU", "RUE PIERRE LEPOUREAU"],
+        "city": ["ST GEORGES DES GARDES", "CHEMILLE EN ANJOU"],
+    }
+    result = Result(doc)
+    result.housenumber = '2 bis'
+    make_labels(None, result)
+    assert result.labels == [
+        '2 bis RUE PIERRE LEPOUREAU 49120 ST GEORGES DES GARDES',
+        'RUE PIERRE LEPOUREAU 49120 ST GEORGES DES GARDES',
+        '2 bis RUE PIERRE LEPOUREAU 49120',
+        'RUE PIERRE LEPOUREAU 49120',
+        '2 bis RUE PIERRE LEPOUREAU ST GEORGES DES GARDES',
+        'RUE PIERRE LEPOUREAU ST GEORGES DES GARDES',
+        '2 bis RUE PIERRE LEPOUREAU',
+        'RUE PIERRE LEPOUREAU',
+        '2 bis RUE PIERRE LEPOUREAU 49120 CHEMILLE EN ANJOU',
+        'RUE PIERRE LEPOUREAU 49120 CHEMILLE EN ANJOU',
+        '2 bis RUE PIERRE LEPOUREAU CHEMILLE EN ANJOU',
+        'RUE PIERRE LEPOUREAU CHEMILLE EN ANJOU',
+    ]
+
+
+def test_make_labels_max(config):
+    config.FRANCE_LABELS_MAX = 3
+    doc = {
+        "_id": "yyyy",
+        "type": "street",
+        "postcode": "49120",
+        "name": "RUE PIERRE LEPOUREAU",
+        "city": ["ST GEORGES DES GARDES", "CHEMILLE EN ANJOU"],
+        "lat": "47.1469",
+        "lon": "-0.75745",
+    }
+    process_documents(json.dumps(doc))
+    assert len(get_document('d|yyyy')['_labels']) == 3
+    result = Result(get_document('d|yyyy'))
+    result.housenumber = '2 bis'
+    make_labels(None, result)
+    assert result.labels == [
+        '2 bis RUE PIERRE LEPOUREAU 49120 ST GEORGES DES GARDES',
+        'RUE PIERRE LEPOUREAU 49120 ST GEORGES DES GARDES',
+        '2 bis RUE PIERRE LEPOUREAU 49120',
+    ]
+
+
+def test_lazy_labels_are_computed_as_needed(config):
+    from types import SimpleNamespace
+
+    from addok_france.utils import score_by_ngram_distance
+    config.FRANCE_LABELS_LAZY = True
+    doc = {
+        "_id": "yyyy",
+        "type": "street",
+        "postcode": "49120",
+        "name": "RUE PIERRE LEPOUREAU",
+        "city": ["ST GEORGES DES GARDES", "CHEMILLE EN ANJOU"],
+    }
+    helper = SimpleNamespace(autocomplete=False,
+                             query='rue pierre lepoureau 49120')
+    result = Result(doc)
+    make_labels(helper, result)
+    assert result.labels == [
+        'RUE PIERRE LEPOUREAU 49120 ST GEORGES DES GARDES']
+    score_by_ngram_distance(helper, result)
+    # Stopped at the first label matching the query.
+    assert result.labels == [
+        'RUE PIERRE LEPOUREAU 49120 ST GEORGES DES GARDES',
+        'RUE PIERRE LEPOUREAU 49120',
+    ]
+    assert result.str_distance == 1.0
+    # Autocomplete needs all labels.
+    helper.autocomplete = True
+    result = Result(doc)
+    make_labels(helper, result)
+    assert len(result.labels) == 6
+
+
 def test_make_labels_empty_city_list(config):
     """Test that empty city list generates base labels without city."""
     doc = {
@@ -557,3 +889,69 @@ def test_make_municipality_labels(config):
         '59000 Lille',
         'Lille 59000',
     ]
+
+
+@pytest.mark.parametrize("label,housenumber", [
+    ["RUE PIERRE LEPOUREAU 49120 ST GEORGES DES GARDES", None],
+    ["RUE PIERRE LEPOUREAU 49120 CHEMILLE EN ANJOU", "2 bis"],
+    ["Place de l'Église", "12"],
+    ["rue", "1"],
+    ["A", None],
+])
+@pytest.mark.parametrize("query", [
+    "2 bis rue pierre lepoureau 49120 chemille en anjou",
+    "rue pierre lepoureau st georges",
+    "12 place de l eglise",
+    "rue",
+    "a",
+])
+def test_max_score_is_an_upper_bound(label, housenumber, query):
+    from types import SimpleNamespace
+
+    from addok.helpers.text import ascii, compare_ngrams
+    from addok_france.utils import (_housenumber_signature, _max_score,
+                                    _query_bigrams, label_signature)
+    signature = (*label_signature(label), 0)
+    if housenumber:
+        signature = _housenumber_signature(signature[:2], housenumber)
+        label = "{} {}".format(housenumber, label)
+        assert signature[0] == len(ascii(label))
+    helper = SimpleNamespace(query=ascii(query))
+    score = compare_ngrams(ascii(label), helper.query)
+    assert score <= _max_score(signature, *_query_bigrams(helper))
+
+
+def test_label_signatures_skip_comparisons(config, monkeypatch):
+    from types import SimpleNamespace
+
+    from addok_france import utils
+    config.FRANCE_LABELS_SIGNATURES = True
+    doc = utils.prepare_labels({
+        "_id": "yyyy",
+        "type": "street",
+        "postcode": "49120",
+        "name": "RUE PIERRE LEPOUREAU",
+        "city": ["ST GEORGES DES GARDES", "CHEMILLE EN ANJOU", "CHANZEAUX",
+                 "LA JUMELLIERE", "LA SALLE DE VIHIERS", "VALANJOU"],
+    })
+    assert len(doc["_signatures"]) == len(doc["_labels"])
+    calls = []
+    compare_ngrams = utils.compare_ngrams
+    monkeypatch.setattr(utils, "compare_ngrams",
+                        lambda *args: calls.append(args) or compare_ngrams(*args))
+    helper = SimpleNamespace(autocomplete=False,
+                             query='2 bis rue lepoureau valanjou')
+
+    def score(doc):
+        result = Result(json.loads(json.dumps(doc)))
+        result.housenumber = "2 bis"
+        make_labels(helper, result)
+        utils.score_by_ngram_distance(helper, result)
+        assert "_signatures" not in result._doc
+        return result.str_distance
+
+    expected = score(dict(doc, _signatures=None))
+    compared = len(calls)
+    calls.clear()
+    assert score(doc) == expected
+    assert 0 < len(calls) < compared